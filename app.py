@@ -1,7 +1,6 @@
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-import httpx
 
 # Load .env BEFORE other imports (try a few likely locations)
 BASE_DIR = Path(__file__).resolve().parent
@@ -22,17 +21,54 @@ def _load_env() -> Path:
 
 ENV_PATH = _load_env()
 
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import replace
+from typing import Dict, List, Optional, Tuple, Union
 from uuid import uuid4
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from pydantic import BaseModel
+
+from forecast import router as forecast_router, parse_at, upstream_stats as forecast_upstream_stats
+from weather import router as weather_router, weather_cell, upstream_stats as weather_upstream_stats
+from music import router as music_router, to_playlist_payload, to_playlist_summary, provider_pool, upstream_stats as music_upstream_stats, AUDIO_PROXY
+from audio_proxy import router as audio_router, upstream_stats as audio_upstream_stats
+from http_client import start_client, close_client
+from geocache import geocache, normalize_city
+from state_store import make_state_store
+from warm_index import BucketIndex, WARM_INDEX
+from tokens import RECOMMENDATION_TOKENS, TOKEN_MAX_SEEN, sign_state, verify_state
+from pipeline import PipelineContext, RecommendationPipeline, REGENERATE_STAGES, WEATHER_STAGES, MUSIC_STAGES, CANDIDATE_POOL_SIZE, CANDIDATE_POOL_TTL
+from config import env_int
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled upstream client for the whole process (keep-alive to OpenWeather + Audius)
+    await start_client()
+    # Background health probes keep the Audius provider ranking fresh
+    await provider_pool.start()
+    if WARM_INDEX:
+        await bucket_index.start()
+    try:
+        yield
+    finally:
+        await bucket_index.stop()
+        await provider_pool.stop()
+        await close_client()
+        geocache.close()
+        recommendation_state.close()
 
-from weather import get_weather, router as weather_router
-from weather import compute_music_profile
-from music import get_audius_playlists, router as music_router, pick_random_playlist, to_playlist_payload, build_audius_queries, pick_best_playlist, get_audius_playlist_tracks, to_track_payload, get_discovery_provider
 
-app = FastAPI(title="MoodWeather")
+app = FastAPI(title="MoodWeather", lifespan=lifespan)
 
 # CORS (frontend → backend)
 app.add_middleware(
@@ -44,7 +80,10 @@ app.add_middleware(
 
 # Register weather and music API
 app.include_router(weather_router)
+app.include_router(forecast_router)
 app.include_router(music_router)
+if AUDIO_PROXY:
+    app.include_router(audio_router)
 
 # Static files (JS + CSS)
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -52,287 +91,311 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Templates (HTML)
 templates = Jinja2Templates(directory="templates")
 
-#In-memory state för att kunna slumpa fram ny speliista utan ny vädersäkning
-recommendation_state = {}
+#State för att kunna slumpa fram ny speliista utan ny vädersäkning (memory eller sqlite, se state_store.py)
+recommendation_state = make_state_store()
 
-@app.get("/api/mashup")
-async def mashup(location: str):
-    """
-    Mashup API: Combines weather data from OpenWeather with music recommendations from Audius.
-    Returns a structured response with weather analysis and playlist selection.
-    """
-    #Fetch weather data
-    try:
-        weather_info = await get_weather(location)
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+# How many recently shown playlists regenerate avoids repeating
+SEEN_PLAYLISTS_MAX = TOKEN_MAX_SEEN
 
-    #  Build music queries from weather profile keywords
-    try:
-        keywords = weather_info.keywords or []
-
-        if not keywords:
-            mood_map = {
-                "happy": ["sunny", "upbeat", "dance"],
-                "sad": ["lofi", "rain", "chill"],
-                "neutral": ["ambient", "peaceful", "instrumental"],
-            }
-            keywords = mood_map.get(weather_info.mood, ["chill"])
-
-        queries = build_audius_queries(keywords, max_queries=6)
-
-        #  Fetch and rank playlists from Audius
-        all_playlists = []
-        dedup = set()
-
-        for q in queries:
-            items = await get_audius_playlists(q, limit=15)
-            for p in items:
-                pid = p.get("id")
-                if pid and pid not in dedup:
-                    dedup.add(pid)
-                    all_playlists.append(p)
-
-        playlist = pick_best_playlist(all_playlists, keywords)
-        if not playlist:
-            mood_query = queries[0] if queries else "chill"
-            fallback = await get_audius_playlists(mood_query, limit=15)
-            playlist = pick_random_playlist(fallback)
-
-        if not playlist:
-            raise HTTPException(status_code=404, detail="No playlist could be selected")
-
-        mood_query = queries[0] if queries else "chill"
-        playlist_payload = to_playlist_payload(playlist)
-
-        # Fetch tracks for the playlist
-        playlist_id = playlist.get("id")
-        provider = await get_discovery_provider()
-        tracks_raw = await get_audius_playlist_tracks(str(playlist_id), limit=25)
-        tracks = [to_track_payload(t, provider) for t in tracks_raw]
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Audius selection failed: {e!r}")
+# Background-warmed keywords → ranked playlists index (only filled when WARM_INDEX=1)
+bucket_index = BucketIndex(pool_size=CANDIDATE_POOL_SIZE)
 
-    # Store state for regeneration
-    rec_id = str(uuid4())
-    recommendation_state[rec_id] = {
-        "mood_query": mood_query,
-        "keywords": keywords,
-        "last_playlist_id": str(playlist.get("id")),
+# weather → keywords → queries → search → rank → tracks (shared by all mashup endpoints)
+pipeline = RecommendationPipeline(index=bucket_index)
+
+# /api/mashup/batch limits
+BATCH_MAX_LOCATIONS = env_int("BATCH_MAX_LOCATIONS", 200)
+BATCH_CONCURRENCY = env_int("BATCH_CONCURRENCY", 8)
+
+
+async def _save_recommendation(state: dict, rec_id: Optional[str] = None) -> str:
+    """Signed token mode: the id *is* the state. Otherwise: store it under a (new) uuid."""
+    if RECOMMENDATION_TOKENS:
+        return sign_state(state)
+    rec_id = rec_id or str(uuid4())
+    await recommendation_state.put(rec_id, state)
+    return rec_id
+
+
+async def _load_recommendation(rec_id: str) -> Optional[dict]:
+    if RECOMMENDATION_TOKENS:
+        return verify_state(rec_id)
+    return await recommendation_state.get(rec_id)
+
+
+def _candidate_pool_state(ctx: PipelineContext) -> dict:
+    """Ranked candidates (+ cursor) to keep with the recommendation so regenerate needn't search."""
+    return {
+        "candidates": [to_playlist_summary(p) for p in ctx.ranked[:CANDIDATE_POOL_SIZE]],
+        "cursor": 0,
+        "pool_ts": time.time(),
     }
 
-    # Return structured mashup response
+
+def _weather_block(ctx: PipelineContext) -> dict:
+    w = ctx.weather
     return {
-        "weather": {
-            "location": weather_info.city,
-            "description": weather_info.description,
-            "temperature": weather_info.temperature,
-            "humidity": weather_info.humidity,
-            "wind_speed": weather_info.wind_speed,
-            "mood": weather_info.mood,
-            "bucket": weather_info.bucket,
-            "scores": weather_info.scores,
-        },
+        "location": w.city,
+        "description": w.description,
+        "temperature": w.temperature,
+        "humidity": w.humidity,
+        "wind_speed": w.wind_speed,
+        "mood": w.mood,
+        "bucket": w.bucket,
+        "scores": w.scores,
+        "forecast_time": w.forecast_time,
+    }
+
+
+def _mashup_response(ctx: PipelineContext, rec_id: str) -> dict:
+    return {
+        "weather": _weather_block(ctx),
         "music": {
-            "keywords": keywords,
-            "mood_query": mood_query,
-            "playlist": playlist_payload,
-            "tracks": tracks,
+            "keywords": ctx.keywords,
+            "mood_query": ctx.mood_query,
+            "playlist": to_playlist_payload(ctx.playlist),
+            "tracks": ctx.tracks,
         },
         "recommendation_id": rec_id,
+        "partial": ctx.partial,
     }
 
 
+async def _run_mashup(ctx: PipelineContext, response: Response) -> dict:
+    await pipeline.run(ctx)
+    response.headers["Server-Timing"] = ctx.server_timing()
+    return await _finish_mashup(ctx)
+
+
+async def _finish_mashup(ctx: PipelineContext) -> dict:
+    # Store state for regeneration
+    playlist_id = str(ctx.playlist.get("id"))
+    rec_id = await _save_recommendation({
+        "mood_query": ctx.mood_query,
+        "keywords": ctx.keywords,
+        "last_playlist_id": playlist_id,
+        "seen_playlist_ids": [playlist_id],
+        **_candidate_pool_state(ctx),
+    })
+
+    # Return structured mashup response
+    return _mashup_response(ctx, rec_id)
+
+
+@app.get("/api/mashup")
+async def mashup(location: str, response: Response, at: Optional[str] = None):
+    """
+    Mashup API: Combines weather data from OpenWeather with music recommendations from Audius.
+    Returns a structured response with weather analysis and playlist selection.
+    `at` (unix seconds or ISO 8601) recommends for the forecast at that time instead of now.
+    """
+    return await _run_mashup(PipelineContext(location=location, at=parse_at(at)), response)
+
+
 @app.get("/api/mashup/coords")
-async def mashup_coords(lat: float, lon: float):
+async def mashup_coords(lat: float, lon: float, response: Response, at: Optional[str] = None):
     """
     Mashup API (geolocation): Combines weather data from OpenWeather with music recommendations from Audius.
-    Uses browser geolocation coordinates instead of city name.
+    Uses browser geolocation coordinates instead of city name. `at` works like on /api/mashup.
     """
-    key = (os.getenv("OPENWEATHER_API_KEY") or "").strip()
-    if not key:
-        raise HTTPException(status_code=500, detail="OPENWEATHER_API_KEY is missing (env not loaded)")
+    return await _run_mashup(PipelineContext(coords=(lat, lon), at=parse_at(at)), response)
 
-    # Fetch weather by coordinates
-    try:
-        async with httpx.AsyncClient(timeout=12.0, follow_redirects=True) as client:
-            r = await client.get(
-                "https://api.openweathermap.org/data/2.5/weather",
-                params={
-                    "lat": lat,
-                    "lon": lon,
-                    "appid": key,
-                    "units": "metric",
-                    "lang": "en",
-                },
-            )
-            r.raise_for_status()
-            payload = r.json()
-    except httpx.HTTPStatusError as e:
-        raise HTTPException(status_code=502, detail=f"Weather API error: {e.response.status_code}") from e
-    except (httpx.RequestError, ValueError) as e:
-        raise HTTPException(status_code=502, detail=f"Weather request failed: {e!r}") from e
-
-    # Compute mood profile
-    try:
-        profile = compute_music_profile(payload)
-        scores = profile.get("scores") or {}
-        bucket = profile.get("bucket") or "neutral"
-        keywords = profile.get("keywords") or []
-
-        valence = int(scores.get("valence", 50))
-        if valence >= 60:
-            mood = "happy"
-        elif valence <= 40:
-            mood = "sad"
-        else:
-            mood = "neutral"
-
-        city = payload.get("name") or "Your location"
-        w0 = (payload.get("weather") or [{}])[0]
-        description = w0.get("description") or w0.get("main") or "weather"
-        main_data = payload.get("main") or {}
-        temperature = float(main_data.get("temp", 0.0))
-        humidity = int(main_data.get("humidity", 50))
-        wind_data = payload.get("wind") or {}
-        wind_speed = float(wind_data.get("speed", 0.0))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Weather profiling failed: {e!r}") from e
-
-    #  Build music queries and fetch playlists
-    try:
-        if not keywords:
-            mood_map = {
-                "happy": ["sunny", "upbeat", "dance"],
-                "sad": ["lofi", "rain", "chill"],
-                "neutral": ["ambient", "peaceful", "instrumental"],
-            }
-            keywords = mood_map.get(mood, ["chill"])
-
-        queries = build_audius_queries(keywords, max_queries=6)
-
-        all_playlists = []
-        dedup = set()
-
-        for q in queries:
-            items = await get_audius_playlists(q, limit=15)
-            for p in items:
-                pid = p.get("id")
-                if pid and pid not in dedup:
-                    dedup.add(pid)
-                    all_playlists.append(p)
-
-        playlist = pick_best_playlist(all_playlists, keywords)
-        if not playlist:
-            mood_query = queries[0] if queries else "chill"
-            fallback = await get_audius_playlists(mood_query, limit=15)
-            playlist = pick_random_playlist(fallback)
-
-        if not playlist:
-            raise HTTPException(status_code=404, detail="No playlist could be selected")
-
-        mood_query = queries[0] if queries else "chill"
-        playlist_payload = to_playlist_payload(playlist)
-
-        # Fetch tracks for the playlist
-        playlist_id = playlist.get("id")
-        provider = await get_discovery_provider()
-        tracks_raw = await get_audius_playlist_tracks(str(playlist_id), limit=25)
-        tracks = [to_track_payload(t, provider) for t in tracks_raw]
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Audius selection failed: {e!r}")
 
-    # Store state for regeneration
-    rec_id = str(uuid4())
-    recommendation_state[rec_id] = {
-        "mood_query": mood_query,
-        "keywords": keywords,
-        "last_playlist_id": str(playlist.get("id")),
-    }
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-    # Return structured mashup response
-    return {
-        "weather": {
-            "location": str(city),
-            "description": str(description),
-            "temperature": temperature,
-            "humidity": humidity,
-            "wind_speed": wind_speed,
-            "mood": mood,
-            "bucket": str(bucket),
-            "scores": scores,
-        },
-        "music": {
-            "keywords": keywords,
-            "mood_query": mood_query,
-            "playlist": playlist_payload,
-            "tracks": tracks,
-        },
-        "recommendation_id": rec_id,
-    }
+
+def _stream_mashup(ctx: PipelineContext) -> StreamingResponse:
+    """
+    Server-Sent Events version of a mashup: `weather` as soon as the weather half is done,
+    then `playlist`, then `tracks`, then `done` (with recommendation_id). Failures arrive
+    as an `error` event, since the 200 + headers are already sent by then.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def _on_stage(name: str, c: PipelineContext) -> None:
+        if name == "keywords":
+            await queue.put(_sse("weather", _weather_block(c)))
+        elif name == "rank":
+            await queue.put(_sse("playlist", {
+                "keywords": c.keywords,
+                "mood_query": c.mood_query,
+                "playlist": to_playlist_payload(c.playlist),
+            }))
+        elif name == "tracks":
+            await queue.put(_sse("tracks", {"tracks": c.tracks}))
+
+    async def _produce() -> None:
+        try:
+            await pipeline.run(ctx, on_stage=_on_stage)
+            body = await _finish_mashup(ctx)
+            await queue.put(_sse("done", {
+                "recommendation_id": body["recommendation_id"],
+                "partial": ctx.partial,
+                "timings": ctx.timings,
+            }))
+        except HTTPException as e:
+            await queue.put(_sse("error", {"detail": e.detail, "status_code": e.status_code}))
+        except Exception:
+            logger.exception("streamed mashup failed")
+            await queue.put(_sse("error", {"detail": "Internal server error", "status_code": 500}))
+        finally:
+            await queue.put(None)
+
+    async def _events():
+        task = asyncio.ensure_future(_produce())
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            task.cancel()
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/mashup/stream")
+async def mashup_stream(location: str, at: Optional[str] = None):
+    """Mashup API (SSE): same result as /api/mashup, delivered stage by stage."""
+    return _stream_mashup(PipelineContext(location=location, at=parse_at(at)))
+
+
+@app.get("/api/mashup/coords/stream")
+async def mashup_coords_stream(lat: float, lon: float, at: Optional[str] = None):
+    """Mashup API (geolocation, SSE): same result as /api/mashup/coords, delivered stage by stage."""
+    return _stream_mashup(PipelineContext(coords=(lat, lon), at=parse_at(at)))
+
+
+class BatchCoords(BaseModel):
+    lat: float
+    lon: float
+
+
+class MashupBatchRequest(BaseModel):
+    cities: List[str] = []
+    coords: List[BatchCoords] = []
+    at: Optional[str] = None  # same meaning as `at` on /api/mashup, for every location
+
+
+def _batch_location_key(item: Union[str, BatchCoords]) -> Tuple:
+    """Inputs that would fetch the same weather (same city / same grid cell) share one run."""
+    if isinstance(item, str):
+        return ("city", normalize_city(item))
+    return ("coords",) + weather_cell(item.lat, item.lon)
+
+
+@app.post("/api/mashup/batch")
+async def mashup_batch(body: MashupBatchRequest):
+    """
+    Bulk mashup: many cities and/or coordinates in one call.
+    Streams one NDJSON line per input location as soon as it's done (order = completion order).
+    Duplicate locations are fetched once, and locations with the same keywords share
+    one search/rank/tracks run.
+    """
+    inputs: List[Union[str, BatchCoords]] = [*body.cities, *body.coords]
+    if not inputs:
+        raise HTTPException(status_code=422, detail="Provide at least one city or coordinate")
+    if len(inputs) > BATCH_MAX_LOCATIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_LOCATIONS} locations per batch")
+    at = parse_at(body.at)
+
+    # location key -> indexes of the inputs that resolve to it
+    groups: Dict[Tuple, List[int]] = {}
+    for i, item in enumerate(inputs):
+        groups.setdefault(_batch_location_key(item), []).append(i)
+
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+    music_runs: Dict[Tuple[str, ...], asyncio.Task] = {}
+
+    async def _music_for(weather_ctx: PipelineContext) -> PipelineContext:
+        music_ctx = PipelineContext(keywords=list(weather_ctx.keywords), weather=weather_ctx.weather)
+        return await pipeline.run(music_ctx, MUSIC_STAGES)
+
+    async def _one(key: Tuple, first: int) -> Tuple[Tuple, dict]:
+        item = inputs[first]
+        async with sem:
+            try:
+                if isinstance(item, str):
+                    ctx = PipelineContext(location=item, at=at)
+                else:
+                    ctx = PipelineContext(coords=(item.lat, item.lon), at=at)
+                await pipeline.run(ctx, WEATHER_STAGES)
+
+                shared_key = tuple(ctx.keywords)
+                if shared_key not in music_runs:
+                    music_runs[shared_key] = asyncio.ensure_future(_music_for(ctx))
+                music_ctx = await asyncio.shield(music_runs[shared_key])
+
+                ctx = replace(music_ctx, weather=ctx.weather, timings={**ctx.timings, **music_ctx.timings})
+                return key, await _finish_mashup(ctx)
+            except HTTPException as e:
+                return key, {"error": e.detail, "status_code": e.status_code}
+            except Exception:
+                # One broken location mustn't cut the stream off for the rest
+                logger.exception("batch mashup failed for %r", item)
+                return key, {"error": "Internal server error", "status_code": 500}
+
+    async def _lines():
+        tasks = [asyncio.ensure_future(_one(k, idxs[0])) for k, idxs in groups.items()]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                key, result = await fut
+                for i in groups[key]:
+                    item = inputs[i]
+                    line = {"index": i, "input": item if isinstance(item, str) else item.model_dump(), **result}
+                    yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            for t in [*tasks, *music_runs.values()]:
+                t.cancel()
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
 
 
 @app.get("/api/recommend/regenerate")
-async def regenerate(recommendation_id: str):
+async def regenerate(recommendation_id: str, response: Response):
     """mode = shuffle för ny spellista """
-    state = recommendation_state.get(recommendation_id)
+    state = await _load_recommendation(recommendation_id)
     if not state:
         raise HTTPException(status_code=404, detail="Recommendation id not found")
 
-    """ Felhantering om ingen querry hittas"""
-
-    mood_query = state["mood_query"]
-    keywords = state.get("keywords") or ["chill"]
+    # Prefer a ranked pick that isn't one of the recently shown playlists
     last_id = state.get("last_playlist_id")
-
-    try:
-        queries = build_audius_queries(keywords, max_queries=6)
-
-        all_playlists = []
-        dedup = set()
-
-        for q in queries:
-            items = await get_audius_playlists(q, limit=15)
-            for p in items:
-                pid = p.get("id")
-                if pid and pid not in dedup:
-                    dedup.add(pid)
-                    all_playlists.append(p)
-
-        # Prefer a ranked pick that isn't the last shown playlist
-        exclude = {last_id} if last_id else set()
-        playlist = pick_best_playlist(all_playlists, keywords, exclude_ids=exclude)
-
-        if not playlist:
-            # Fallback: random but still avoid repeats
-            fallback = await get_audius_playlists(mood_query, limit=15)
-            playlist = pick_random_playlist(fallback, exclude_ids=exclude)
-
-        if not playlist:
-            raise HTTPException(status_code=404, detail="No new playlists found")
-
-        state["last_playlist_id"] = str(playlist.get("id"))
-
-        # Fetch tracks for the playlist
-        playlist_id = playlist.get("id")
-        provider = await get_discovery_provider()
-        tracks_raw = await get_audius_playlist_tracks(str(playlist_id), limit=25)
-        tracks = [to_track_payload(t, provider) for t in tracks_raw]
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Audius regenerate failed: {e!r}")
+    seen = list(state.get("seen_playlist_ids") or ([last_id] if last_id else []))
+    # Walk the cached ranked pool first; fresh searches only once it's used up or stale
+    pool_fresh = (time.time() - float(state.get("pool_ts") or 0)) < CANDIDATE_POOL_TTL
+    ctx = PipelineContext(
+        keywords=state.get("keywords") or ["chill"],
+        mood_query=state["mood_query"],
+        exclude_ids=set(seen),
+        pool=(state.get("candidates") or []) if pool_fresh else [],
+        pool_cursor=int(state.get("cursor") or 0),
+        error_label="Audius regenerate failed",
+        not_found_detail="No new playlists found",
+    )
+    await pipeline.run(ctx, REGENERATE_STAGES)
+    response.headers["Server-Timing"] = ctx.server_timing()
+
+    playlist_id = str(ctx.playlist.get("id"))
+    state["last_playlist_id"] = playlist_id
+    state["seen_playlist_ids"] = (seen + [playlist_id])[-SEEN_PLAYLISTS_MAX:]
+    if ctx.from_pool:
+        state["cursor"] = ctx.pool_cursor
+    else:
+        state.update(_candidate_pool_state(ctx))
+    rec_id = await _save_recommendation(state, recommendation_id)
 
     return {
-        "mood_query": mood_query,
-        "playlist": to_playlist_payload(playlist),
-        "tracks": tracks,
+        "mood_query": ctx.mood_query,
+        "playlist": to_playlist_payload(ctx.playlist),
+        "tracks": ctx.tracks,
+        "recommendation_id": rec_id,
+        "partial": ctx.partial,
     }
 
 @app.get("/api/debug/env")
@@ -359,6 +422,21 @@ async def debug_env():
     }
 
 
+@app.get("/api/debug/upstream")
+async def debug_upstream():
+    """
+    Debug helper: request coalescing (singleflight) and cache counters for upstream calls.
+    """
+    return {
+        "audius": music_upstream_stats(),
+        "openweather": weather_upstream_stats(),
+        "forecast": forecast_upstream_stats(),
+        "recommendation_state": await recommendation_state.stats(),
+        "warm_index": bucket_index.snapshot(),
+        "audio_cache": audio_upstream_stats() if AUDIO_PROXY else None,
+    }
+
+
 # Serve frontend
 @app.get("/")
 async def home(request: Request):
@@ -0,0 +1,351 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import aclosing
+from pathlib import Path
+from typing import Any, AsyncIterator, BinaryIO, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+from config import env_int
+from http_client import get_client
+from music import APP_NAME, get_discovery_provider
+
+# Caching audio proxy: /api/music/stream/{track_id} (enabled with AUDIO_PROXY=1, see music.py).
+#
+# Audio is cached on local disk in fixed-size chunks per track. Range requests whose
+# chunks are all cached are served straight from those files, zero-copy when the ASGI
+# server offers the `http.response.zerocopysend` extension (os.sendfile under the hood).
+# Missing chunks are fetched from the discovery provider with one ranged request per run
+# of consecutive misses, streamed through to the listener and written to disk as they
+# complete. Whole tracks are evicted least recently used first past AUDIO_CACHE_MAX_BYTES.
+# Two listeners missing the same chunk both fetch it; chunk writes are atomic either way.
+
+router = APIRouter(prefix="/api/music", tags=["music"])
+
+AUDIO_CACHE_DIR = Path(
+    os.getenv("AUDIO_CACHE_DIR") or (Path(__file__).resolve().parent / ".cache" / "audio")
+)
+AUDIO_CACHE_MAX_BYTES = env_int("AUDIO_CACHE_MAX_BYTES", 2 << 30)
+AUDIO_CHUNK_SIZE = env_int("AUDIO_CHUNK_SIZE", 1 << 20)
+
+# Track ids become directory names
+_TRACK_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+_CONTENT_RANGE_RE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+class AudioCache:
+    """Chunk files + meta.json per track under `root` (all methods are blocking disk I/O)."""
+
+    def __init__(self, root: Path = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES, chunk_size: int = AUDIO_CHUNK_SIZE) -> None:
+        self.root = Path(root)
+        self.max_bytes = max(1, int(max_bytes))
+        self.chunk_size = max(64 << 10, int(chunk_size))
+        self._usage: "OrderedDict[str, int]" = OrderedDict()  # track id -> bytes on disk, LRU order
+        self._bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"chunk_hits": 0, "chunk_misses": 0, "evictions": 0}
+
+    def _dir(self, track_id: str) -> Path:
+        return self.root / track_id
+
+    def chunk_path(self, track_id: str, index: int) -> Path:
+        return self._dir(track_id) / f"{index:06d}.chunk"
+
+    def _load(self) -> None:
+        """Pick up what earlier runs left on disk (oldest first)."""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.root.is_dir():
+            return
+        found = []
+        for d in self.root.iterdir():
+            if d.is_dir():
+                files = [f.stat() for f in d.iterdir() if f.is_file()]
+                found.append((max((s.st_mtime for s in files), default=0.0), d.name, sum(s.st_size for s in files)))
+        for _, track_id, size in sorted(found):
+            self._usage[track_id] = size
+            self._bytes += size
+
+    def touch(self, track_id: str) -> None:
+        with self._lock:
+            self._load()
+            if track_id in self._usage:
+                self._usage.move_to_end(track_id)
+
+    def meta(self, track_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            meta = json.loads((self._dir(track_id) / "meta.json").read_text())
+        except (OSError, ValueError):
+            return None
+        if meta.get("chunk_size") != self.chunk_size or not isinstance(meta.get("size"), int):
+            return None
+        return meta
+
+    def _write(self, path: Path, data: bytes) -> int:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        return len(data)
+
+    def _account(self, track_id: str, delta: int) -> None:
+        with self._lock:
+            self._load()
+            self._usage[track_id] = self._usage.get(track_id, 0) + delta
+            self._usage.move_to_end(track_id)
+            self._bytes += delta
+            victims = []
+            while self._bytes > self.max_bytes and len(self._usage) > 1:
+                victim, size = next(iter(self._usage.items()))
+                if victim == track_id:
+                    break
+                del self._usage[victim]
+                self._bytes -= size
+                victims.append(victim)
+        for victim in victims:
+            shutil.rmtree(self._dir(victim), ignore_errors=True)
+            self.stats["evictions"] += 1
+
+    def write_meta(self, track_id: str, size: int, content_type: str) -> Dict[str, Any]:
+        meta = {"size": size, "content_type": content_type, "chunk_size": self.chunk_size}
+        if self.meta(track_id) == meta:
+            return meta
+        # New track, or a different file (or chunk size) than what's cached: start over
+        shutil.rmtree(self._dir(track_id), ignore_errors=True)
+        with self._lock:
+            self._load()
+            self._bytes -= self._usage.pop(track_id, 0)
+        self._account(track_id, self._write(self._dir(track_id) / "meta.json", json.dumps(meta).encode()))
+        return meta
+
+    def write_chunk(self, track_id: str, index: int, data: bytes) -> None:
+        path = self.chunk_path(track_id, index)
+        try:
+            old = path.stat().st_size
+        except OSError:
+            old = 0
+        self._account(track_id, self._write(path, data) - old)
+
+    def read_chunk(self, track_id: str, index: int) -> Optional[bytes]:
+        try:
+            data = self.chunk_path(track_id, index).read_bytes()
+        except OSError:
+            self.stats["chunk_misses"] += 1
+            return None
+        self.stats["chunk_hits"] += 1
+        return data
+
+    def open_chunks(self, track_id: str, first: int, last: int) -> Optional[List[BinaryIO]]:
+        """Open chunks first..last for serving; None (nothing left open) if any is missing."""
+        files: List[BinaryIO] = []
+        try:
+            for i in range(first, last + 1):
+                files.append(open(self.chunk_path(track_id, i), "rb"))
+        except OSError:
+            for f in files:
+                f.close()
+            self.stats["chunk_misses"] += 1
+            return None
+        self.stats["chunk_hits"] += len(files)
+        return files
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "tracks": len(self._usage), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+audio_cache = AudioCache()
+
+
+def parse_range(header: Optional[str], total: int) -> Optional[Tuple[int, int]]:
+    """
+    `Range: bytes=...` -> inclusive (start, end), or None to send the whole file
+    (no header, an invalid one, or several ranges, which we don't do). Unsatisfiable,
+    i.e. nothing of it inside the file -> 416.
+    """
+    if not header or not header.strip().lower().startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header.strip()[6:].partition("-")
+    try:
+        if first.strip():
+            start = int(first)
+            if not last.strip():
+                end = total - 1
+            elif int(last) >= start:
+                end = int(last)
+            else:
+                # Last byte before the first (bytes=100-50) is invalid, and invalid ranges are ignored
+                return None
+        else:
+            start, end = max(0, total - int(last)), total - 1  # suffix: last N bytes
+    except ValueError:
+        return None
+    end = min(end, total - 1)
+    if start > end or start >= total:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{total}"})
+    return start, end
+
+
+async def _upstream_chunks(track_id: str, first: int, last: Optional[int]) -> AsyncIterator[Tuple[int, bytes, Dict[str, Any]]]:
+    """
+    Fetch chunks first..last (None = to the end) with one ranged GET, writing each to the
+    cache as it completes. Yields (index, data, meta); meta is written on the way if new.
+    """
+    cs = audio_cache.chunk_size
+    start = first * cs
+    byte_range = f"bytes={start}-" + (str((last + 1) * cs - 1) if last is not None else "")
+    provider = await get_discovery_provider()
+    url = f"{provider.rstrip('/')}/v1/tracks/{track_id}/stream"
+
+    try:
+        async with get_client().stream("GET", url, params={"app_name": APP_NAME}, headers={"Range": byte_range}) as r:
+            if r.status_code == 404:
+                raise HTTPException(status_code=404, detail="Track not found")
+            r.raise_for_status()
+
+            if r.status_code == 206:
+                m = _CONTENT_RANGE_RE.match(r.headers.get("content-range") or "")
+                if m is None or m.group(3) == "*" or int(m.group(1)) != start:
+                    raise HTTPException(status_code=502, detail="Audius stream returned an unusable range")
+                total, skip = int(m.group(3)), 0
+            else:
+                # No range support upstream: the whole file, so skip up to our offset
+                total, skip = int(r.headers.get("content-length") or -1), start
+            if total < 0:
+                raise HTTPException(status_code=502, detail="Audius stream has no known length")
+
+            meta = await asyncio.to_thread(audio_cache.meta, track_id)
+            if meta is None or meta["size"] != total:
+                content_type = (r.headers.get("content-type") or "audio/mpeg").split(";")[0]
+                meta = await asyncio.to_thread(audio_cache.write_meta, track_id, total, content_type)
+
+            last_index = (total - 1) // cs if last is None else min(last, (total - 1) // cs)
+            index, buf = first, bytearray()
+            async for data in r.aiter_bytes():
+                if skip:
+                    cut = min(skip, len(data))
+                    data, skip = data[cut:], skip - cut
+                buf += data
+                while index <= last_index:
+                    want = min(cs, total - index * cs)
+                    if len(buf) < want:
+                        break
+                    chunk = bytes(buf[:want])
+                    del buf[:want]
+                    await asyncio.to_thread(audio_cache.write_chunk, track_id, index, chunk)
+                    yield index, chunk, meta
+                    index += 1
+                if index > last_index:
+                    return
+            if index <= last_index:
+                raise HTTPException(status_code=502, detail="Audius stream ended early")
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=502, detail=f"Audius stream error: {e.response.status_code}") from e
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=502, detail=f"Audius stream failed: {e!r}") from e
+
+
+async def _ensure_meta(track_id: str) -> Dict[str, Any]:
+    meta = await asyncio.to_thread(audio_cache.meta, track_id)
+    if meta is not None:
+        return meta
+    # First listener: fetching chunk 0 tells us the size (and playback starts there anyway)
+    async with aclosing(_upstream_chunks(track_id, 0, 0)) as chunks:
+        async for _, _, meta in chunks:
+            return meta
+    raise HTTPException(status_code=502, detail="Audius stream is empty")
+
+
+class _ChunkFileResponse(Response):
+    """Byte range served from open chunk files: zero-copy sends when the server supports them."""
+
+    def __init__(self, files: List[BinaryIO], start: int, end: int, chunk_size: int, status_code: int, headers: Dict[str, str], media_type: str) -> None:
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.files = files
+        self.start, self.end, self.chunk_size = start, end, chunk_size
+
+    def _parts(self) -> List[Tuple[BinaryIO, int, int]]:
+        base = (self.start // self.chunk_size) * self.chunk_size
+        parts = []
+        for i, f in enumerate(self.files):
+            lo = max(self.start - base - i * self.chunk_size, 0)
+            hi = min(self.end - base - i * self.chunk_size + 1, self.chunk_size)
+            parts.append((f, lo, hi - lo))
+        return parts
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            zerocopy = "http.response.zerocopysend" in (scope.get("extensions") or {})
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            for f, offset, count in self._parts():
+                if zerocopy:
+                    await send({"type": "http.response.zerocopysend", "file": f, "offset": offset, "count": count, "more_body": True})
+                else:
+                    f.seek(offset)
+                    await send({"type": "http.response.body", "body": await asyncio.to_thread(f.read, count), "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            for f in self.files:
+                f.close()
+
+
+async def _stream_range(track_id: str, start: int, end: int) -> AsyncIterator[bytes]:
+    """Bytes start..end: cached chunks from disk, runs of missing chunks from upstream."""
+    cs = audio_cache.chunk_size
+    index, last = start // cs, end // cs
+    while index <= last:
+        data = await asyncio.to_thread(audio_cache.read_chunk, track_id, index)
+        if data is not None:
+            yield data[max(start - index * cs, 0):end - index * cs + 1]
+            index += 1
+            continue
+        run_end = index
+        while run_end < last and not audio_cache.chunk_path(track_id, run_end + 1).exists():
+            run_end += 1
+        async for i, chunk, _ in _upstream_chunks(track_id, index, run_end):
+            yield chunk[max(start - i * cs, 0):end - i * cs + 1]
+        index = run_end + 1
+
+
+@router.get("/stream/{track_id}")
+async def stream_track(track_id: str, request: Request):
+    """
+    Track audio through the local chunk cache (supports Range, so seeking works).
+    """
+    if not _TRACK_ID_RE.match(track_id):
+        raise HTTPException(status_code=404, detail="Track not found")
+
+    meta = await _ensure_meta(track_id)
+    total = meta["size"]
+    byte_range = parse_range(request.headers.get("range"), total)
+    start, end = byte_range or (0, total - 1)
+    await asyncio.to_thread(audio_cache.touch, track_id)
+
+    status = 206 if byte_range else 200
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(end - start + 1),
+        "Cache-Control": "public, max-age=86400",
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+
+    cs = audio_cache.chunk_size
+    files = await asyncio.to_thread(audio_cache.open_chunks, track_id, start // cs, end // cs)
+    if files is not None:
+        return _ChunkFileResponse(files, start, end, cs, status, headers, meta["content_type"])
+    return StreamingResponse(_stream_range(track_id, start, end), status_code=status, headers=headers, media_type=meta["content_type"])
+
+
+def upstream_stats() -> Dict[str, Any]:
+    return audio_cache.snapshot()
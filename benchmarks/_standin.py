@@ -0,0 +1,160 @@
+"""
+Tiny local stand-in for the upstream APIs (OpenWeather / Audius) used by the benchmarks.
+
+It speaks just enough HTTP/1.1 (keep-alive, Content-Length) to be hit by httpx, and
+cleartext HTTP/2 with prior knowledge (h2c, needs the `h2` package) when a client
+opens with the HTTP/2 preface. `handshake_ms` is slept once per *new connection* to
+model the TCP+TLS setup cost we pay against the real hosts; `latency_ms` is slept
+per request (concurrently across HTTP/2 streams).
+"""
+from __future__ import annotations
+import asyncio
+import json
+from typing import Any, Callable, Dict, Optional, Tuple
+
+Handler = Callable[[str], Any]
+
+
+def _default_handler(path: str) -> Any:
+    return {"data": [{"id": f"pl{i}", "playlist_name": f"chill mix {i}"} for i in range(15)]}
+
+
+class StandInServer:
+    def __init__(
+        self,
+        handshake_ms: float = 0.0,
+        latency_ms: float = 0.0,
+        handler: Optional[Handler] = None,
+    ) -> None:
+        self.handshake_ms = handshake_ms
+        self.latency_ms = latency_ms
+        self.handler = handler or _default_handler
+        self.connections = 0
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.port = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def __aenter__(self) -> "StandInServer":
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader, line: Optional[bytes] = None
+    ) -> Optional[Tuple[str, Dict[str, str]]]:
+        if line is None:
+            line = await reader.readline()
+        if not line:
+            return None
+        parts = line.decode("latin-1").split()
+        path = parts[1] if len(parts) > 1 else "/"
+        headers: Dict[str, str] = {}
+        while True:
+            h = await reader.readline()
+            if h in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = h.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        length = int(headers.get("content-length") or 0)
+        if length:
+            await reader.readexactly(length)
+        return path, headers
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        if self.handshake_ms:
+            await asyncio.sleep(self.handshake_ms / 1000.0)
+        try:
+            first: Optional[bytes] = await reader.readline()
+            if first and first.startswith(b"PRI * HTTP/2.0"):
+                await self._serve_h2(first, reader, writer)
+                return
+            while True:
+                req = await self._read_request(reader, first)
+                first = None
+                if req is None:
+                    break
+                path, headers = req
+                self.requests += 1
+                if self.latency_ms:
+                    await asyncio.sleep(self.latency_ms / 1000.0)
+                body = json.dumps(self.handler(path)).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_h2(self, data: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        from h2.config import H2Configuration
+        from h2.connection import H2Connection
+        from h2.events import ConnectionTerminated, RequestReceived, StreamEnded, WindowUpdated
+
+        conn = H2Connection(config=H2Configuration(client_side=False, header_encoding="utf-8"))
+        conn.initiate_connection()
+        window_open = asyncio.Event()
+        tasks = set()
+
+        async def _respond(stream_id: int, path: str) -> None:
+            self.requests += 1
+            if self.latency_ms:
+                await asyncio.sleep(self.latency_ms / 1000.0)
+            body = json.dumps(self.handler(path)).encode()
+            conn.send_headers(
+                stream_id,
+                [(":status", "200"), ("content-type", "application/json"), ("content-length", str(len(body)))],
+            )
+            while body:
+                window = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size)
+                if window <= 0:
+                    window_open.clear()
+                    await window_open.wait()
+                    continue
+                chunk, body = body[:window], body[window:]
+                conn.send_data(stream_id, chunk, end_stream=not body)
+                writer.write(conn.data_to_send())
+
+        paths: Dict[int, str] = {}
+        while data:
+            for event in conn.receive_data(data):
+                if isinstance(event, RequestReceived):
+                    paths[event.stream_id] = dict(event.headers).get(":path", "/")
+                elif isinstance(event, StreamEnded) and event.stream_id in paths:
+                    task = asyncio.ensure_future(_respond(event.stream_id, paths.pop(event.stream_id)))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                elif isinstance(event, WindowUpdated):
+                    window_open.set()
+                elif isinstance(event, ConnectionTerminated):
+                    data = b""
+            writer.write(conn.data_to_send())
+            await writer.drain()
+            if data:
+                data = await reader.read(65536)
+        for task in list(tasks):
+            task.cancel()
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
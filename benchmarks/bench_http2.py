@@ -0,0 +1,101 @@
+"""
+Benchmark: upstream traffic over HTTP/1.1 vs. HTTP/2 (UPSTREAM_HTTP2=1), both pooled.
+
+Each simulated mashup sends six concurrent playlist searches and then the track
+fetch to one discovery provider, `--concurrency` mashups at a time, against a local
+stand-in that charges `--handshake-ms` per new connection. HTTP/1.1 needs a
+connection per in-flight request; HTTP/2 multiplexes them over one. HTTP/2 runs as
+cleartext h2c with prior knowledge (the real hosts negotiate it via TLS ALPN).
+
+    python benchmarks/bench_http2.py --rounds 200 --concurrency 8 --handshake-ms 40 --latency-ms 20
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List, Set, Tuple
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from _standin import StandInServer, percentile  # noqa: E402
+from http_client import build_client, http2_available  # noqa: E402
+
+SEARCHES_PER_MASHUP = 6
+
+
+async def _mashup(client: httpx.AsyncClient, base_url: str, versions: Set[str]) -> float:
+    t0 = time.perf_counter()
+    searches = await asyncio.gather(*(
+        client.get(f"{base_url}/v1/playlists/search", params={"query": f"q{i}"})
+        for i in range(SEARCHES_PER_MASHUP)
+    ))
+    tracks = await client.get(f"{base_url}/v1/playlists/pl0/tracks")
+    for r in (*searches, tracks):
+        r.raise_for_status()
+        r.json()
+        versions.add(r.http_version)
+    return (time.perf_counter() - t0) * 1000.0
+
+
+async def _run(client: httpx.AsyncClient, base_url: str, rounds: int, concurrency: int) -> Tuple[List[float], Set[str]]:
+    samples: List[float] = []
+    versions: Set[str] = set()
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _one() -> None:
+        async with sem:
+            samples.append(await _mashup(client, base_url, versions))
+
+    try:
+        await asyncio.gather(*(_one() for _ in range(rounds)))
+    finally:
+        await client.aclose()
+    return samples, versions
+
+
+def _report(name: str, samples: List[float], connections: int, versions: Set[str]) -> None:
+    print(
+        f"{name:>8}: mean {statistics.mean(samples):7.1f} ms  "
+        f"p50 {percentile(samples, 50):7.1f} ms  p99 {percentile(samples, 99):7.1f} ms  "
+        f"connections {connections}  (served as {', '.join(sorted(versions))})"
+    )
+
+
+async def main(rounds: int, concurrency: int, handshake_ms: float, latency_ms: float) -> None:
+    if not http2_available():
+        print("h2 is not installed (pip install -r requirements-optional.txt)")
+        return
+
+    results = {}
+    for name, client_kwargs in (("HTTP/1.1", {"http2": False}), ("HTTP/2", {"http2": True, "http1": False})):
+        async with StandInServer(handshake_ms=handshake_ms, latency_ms=latency_ms) as server:
+            samples, versions = await _run(build_client(**client_kwargs), server.base_url, rounds, concurrency)
+            results[name] = (samples, server.connections, versions)
+
+    print(
+        f"{rounds} mashups ({SEARCHES_PER_MASHUP} concurrent searches + track fetch), {concurrency} at a time, "
+        f"handshake {handshake_ms} ms, latency {latency_ms} ms"
+    )
+    for name, (samples, connections, versions) in results.items():
+        _report(name, samples, connections, versions)
+    h1, h2 = results["HTTP/1.1"][0], results["HTTP/2"][0]
+    print(
+        f"HTTP/2 vs HTTP/1.1: p50 {percentile(h1, 50) / max(percentile(h2, 50), 1e-9):.2f}x, "
+        f"p99 {percentile(h1, 99) / max(percentile(h2, 99), 1e-9):.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rounds", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--handshake-ms", type=float, default=40.0)
+    ap.add_argument("--latency-ms", type=float, default=20.0)
+    args = ap.parse_args()
+    asyncio.run(main(args.rounds, args.concurrency, args.handshake_ms, args.latency_ms))
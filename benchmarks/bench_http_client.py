@@ -0,0 +1,85 @@
+"""
+Benchmark: fresh httpx.AsyncClient per call vs. the shared pooled client.
+
+Simulates one /api/mashup worth of upstream traffic (8 sequential calls) against a
+local stand-in server that charges `--handshake-ms` per new connection.
+
+    python benchmarks/bench_http_client.py --rounds 50 --handshake-ms 40 --latency-ms 5
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from _standin import StandInServer, percentile  # noqa: E402
+from http_client import build_client  # noqa: E402
+
+CALLS_PER_MASHUP = 8
+
+
+async def _fresh_client_round(url: str) -> None:
+    for _ in range(CALLS_PER_MASHUP):
+        async with httpx.AsyncClient(timeout=12.0, follow_redirects=True) as client:
+            r = await client.get(url, params={"query": "chill"})
+            r.raise_for_status()
+            r.json()
+
+
+async def _pooled_round(client: httpx.AsyncClient, url: str) -> None:
+    for _ in range(CALLS_PER_MASHUP):
+        r = await client.get(url, params={"query": "chill"})
+        r.raise_for_status()
+        r.json()
+
+
+def _report(name: str, samples: list, connections: int) -> None:
+    print(
+        f"{name:>8}: mean {statistics.mean(samples):7.1f} ms  "
+        f"p50 {percentile(samples, 50):7.1f} ms  p95 {percentile(samples, 95):7.1f} ms  "
+        f"connections {connections}"
+    )
+
+
+async def main(rounds: int, handshake_ms: float, latency_ms: float) -> None:
+    async with StandInServer(handshake_ms=handshake_ms, latency_ms=latency_ms) as server:
+        url = f"{server.base_url}/v1/playlists/search"
+
+        fresh = []
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            await _fresh_client_round(url)
+            fresh.append((time.perf_counter() - t0) * 1000.0)
+        fresh_conns = server.connections
+
+        server.connections = 0
+        pooled = []
+        client = build_client()
+        try:
+            for _ in range(rounds):
+                t0 = time.perf_counter()
+                await _pooled_round(client, url)
+                pooled.append((time.perf_counter() - t0) * 1000.0)
+        finally:
+            await client.aclose()
+
+    print(f"{rounds} mashups x {CALLS_PER_MASHUP} upstream calls, handshake {handshake_ms} ms, latency {latency_ms} ms")
+    _report("fresh", fresh, fresh_conns)
+    _report("pooled", pooled, server.connections)
+    print(f"speedup (p50): {percentile(fresh, 50) / max(percentile(pooled, 50), 1e-9):.2f}x")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rounds", type=int, default=50)
+    ap.add_argument("--handshake-ms", type=float, default=40.0)
+    ap.add_argument("--latency-ms", type=float, default=5.0)
+    args = ap.parse_args()
+    asyncio.run(main(args.rounds, args.handshake_ms, args.latency_ms))
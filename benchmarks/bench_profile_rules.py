@@ -0,0 +1,199 @@
+"""
+Benchmark: weather.compute_music_profile (driven by the profile_rules table) vs. the
+hand-written if/elif profiler it replaced.
+
+The reference below is that profiler as it was. Both share observation_features, so
+besides whole calls the scoring step is timed on its own: RuleSet.profile vs. the
+reference on the same features. Payloads are bench_weather_batch's; results are checked
+to be identical, then everything is timed in alternating rounds (best of each), so
+machine noise hits all of them alike.
+
+    python benchmarks/bench_profile_rules.py --payloads 2000 --repeat 100
+"""
+from __future__ import annotations
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_weather_batch import make_payloads  # noqa: E402
+from profile_rules import active_rules  # noqa: E402
+from weather import compute_music_profile, observation_features  # noqa: E402
+
+REFERENCE_KEYWORDS: Dict[str, List[str]] = {
+    "energy": ["upbeat", "dance", "workout", "house", "pop"],
+    "brightness": ["happy", "feel good", "sunny", "uplifting", "bright"],
+    "cozy": ["cozy", "lofi", "acoustic", "coffeehouse", "warm"],
+    "intensity": ["cinematic", "dark", "intense", "dramatic", "bass"],
+    "focus": ["focus", "study", "ambient", "instrumental", "chill"],
+    "storm_intense": ["storm", "cinematic", "dark", "intense", "ambient"],
+    "night_chill": ["night", "late night", "chill", "synthwave", "ambient"],
+}
+
+
+def _reference_keywords(
+    bucket: str, top_dims: Sequence[str], feels_like: float, is_night: bool, cloud_n: float, rainy: bool
+) -> List[str]:
+    keywords: List[str] = []
+    if bucket in REFERENCE_KEYWORDS:
+        keywords = REFERENCE_KEYWORDS[bucket][:]
+    else:
+        for d in top_dims:
+            keywords.extend(REFERENCE_KEYWORDS.get(d, []))
+        seen = set()
+        keywords = [k for k in keywords if not (k in seen or seen.add(k))]
+
+    if feels_like <= 8.0:
+        keywords.extend(["winter", "cold", "cozy"])
+    elif feels_like >= 22.0 and (not is_night) and cloud_n < 0.5:
+        keywords.extend(["summer", "sunshine"])
+    if is_night:
+        keywords.extend(["night", "late night"])
+    if cloud_n >= 0.8:
+        keywords.extend(["overcast", "moody"])
+    if rainy:
+        keywords.extend(["rainy day", "lofi beats"])
+
+    seen = set()
+    return [k for k in keywords if not (k in seen or seen.add(k))]
+
+
+def reference_scores(obs: Dict[str, Any]) -> Dict[str, Any]:
+    """The profile from observation_features as it was: the default rules written out as if/elif."""
+    main, desc = obs["main"], obs["desc"]
+    feels_like, is_night = obs["feels_like"], obs["is_night"]
+    cloud_n, wind_n, gust_n = obs["cloud_n"], obs["wind_n"], obs["gust_n"]
+    hum_n, vis_n, comfort = obs["hum_n"], obs["vis_n"], obs["comfort"]
+    pressure = obs["pressure"]
+
+    energy = brightness = cozy = intensity = focus = 50
+    if "thunder" in main or "storm" in main:
+        intensity += 35
+        brightness -= 30
+        energy += 5
+        focus -= 10
+        cozy += 10
+    elif "rain" in main or "drizzle" in main:
+        cozy += 25
+        brightness -= 25
+        energy -= 15
+        intensity += 10
+        focus += 15
+    elif "snow" in main:
+        cozy += 15
+        energy -= 20
+        brightness += 5
+        focus += 15
+    elif "clear" in main:
+        energy += 20
+        brightness += 30
+        intensity -= 10
+        focus += 5
+        cozy -= 5
+    elif "cloud" in main:
+        brightness -= 15
+        cozy += 10
+        focus += 10
+        energy -= 5
+    elif any(k in main for k in ["mist", "fog", "haze", "smoke"]):
+        brightness -= 20
+        focus += 20
+        energy -= 10
+        cozy += 10
+
+    energy += round(15 * comfort)
+    brightness += round(12 * comfort)
+    cozy += round(10 * (1.0 - comfort))
+    brightness -= round(30 * cloud_n)
+    cozy += round(10 * cloud_n)
+    focus += round(8 * cloud_n)
+    cozy += round(15 * hum_n)
+    focus += round(6 * hum_n)
+    brightness -= round(10 * hum_n)
+    intensity += round(25 * wind_n) + round(10 * gust_n)
+    focus -= round(10 * wind_n)
+    focus += round(12 * (1.0 - vis_n))
+    brightness -= round(8 * (1.0 - vis_n))
+
+    if is_night:
+        brightness -= 15
+        focus += 10
+        cozy += 10
+        energy -= 5
+    if isinstance(pressure, (int, float)) and pressure < 1005:
+        intensity += 5
+
+    def cap(v: int) -> int:
+        return int(max(0, min(100, v)))
+
+    raw_valence = (0.55 * brightness) + (0.25 * energy) + (0.20 * comfort * 100) - (0.35 * intensity)
+    if is_night:
+        raw_valence -= 8
+
+    scores = {
+        "energy": cap(energy),
+        "brightness": cap(brightness),
+        "cozy": cap(cozy),
+        "intensity": cap(intensity),
+        "focus": cap(focus),
+        "valence": cap(int(round(raw_valence))),
+    }
+
+    if "thunder" in main or "storm" in desc:
+        bucket = "storm_intense"
+    elif is_night and scores["energy"] < 55:
+        bucket = "night_chill"
+    else:
+        top = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        bucket = f"{top[0][0]}_{top[1][0]}"
+
+    top_dims = [d for d, _ in sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:2]]
+    rainy = "rain" in main or "drizzle" in main or "rain" in desc
+    keywords = _reference_keywords(bucket, top_dims, feels_like, is_night, cloud_n, rainy)
+    return {"scores": scores, "bucket": bucket, "keywords": keywords}
+
+
+def reference_profile(weather_json: Dict[str, Any]) -> Dict[str, Any]:
+    """compute_music_profile as it was."""
+    return reference_scores(observation_features(weather_json))
+
+
+def main(n: int, repeat: int) -> None:
+    payloads = make_payloads(n)
+    if [reference_profile(p) for p in payloads] != [compute_music_profile(p) for p in payloads]:
+        raise SystemExit("rule-driven and reference profiles differ")
+
+    rules = active_rules()
+    features = [observation_features(p) for p in payloads]
+    runs = {
+        "reference": lambda: [reference_profile(p) for p in payloads],
+        "rules": lambda: [compute_music_profile(p) for p in payloads],
+        "reference_scoring": lambda: [reference_scores(f) for f in features],
+        "rules_scoring": lambda: [rules.profile(f) for f in features],
+        "features": lambda: [observation_features(p) for p in payloads],
+    }
+    best = dict.fromkeys(runs, float("inf"))
+    for _ in range(repeat):
+        for name, fn in runs.items():
+            t0 = time.perf_counter()
+            fn()
+            best[name] = min(best[name], time.perf_counter() - t0)
+    us = {name: t / n * 1e6 for name, t in best.items()}
+
+    print(f"{n} payloads, best of {repeat} alternating rounds (results identical)")
+    print(f"           whole call    scoring only")
+    print(f"reference: {us['reference']:6.2f} us     {us['reference_scoring']:6.2f} us")
+    print(f"    rules: {us['rules']:6.2f} us     {us['rules_scoring']:6.2f} us")
+    print(f"speedup:   {us['reference'] / us['rules']:6.2f}x      {us['reference_scoring'] / us['rules_scoring']:6.2f}x")
+    print(f"(observation_features, shared: {us['features']:.2f} us)")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--payloads", type=int, default=2_000)
+    ap.add_argument("--repeat", type=int, default=100)
+    args = ap.parse_args()
+    main(args.payloads, args.repeat)
@@ -0,0 +1,116 @@
+"""
+Benchmark: the ranking stage (music.rank_playlists) with and without the playlist index.
+
+Simulates mashup traffic: each request ranks ~90 search results (6 queries x 15) drawn
+from a catalogue of popular playlists that keep coming back, for keywords the weather
+profiles can produce. The reference re-tokenizes every playlist and sorts everything,
+like rank_playlists did before the index. Orderings are checked to be identical.
+
+    python benchmarks/bench_ranking.py --requests 5000 --catalogue 2000 --repeat 3
+"""
+from __future__ import annotations
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Set, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import music  # noqa: E402
+from pipeline import CANDIDATE_POOL_SIZE  # noqa: E402
+from warm_index import enumerate_keyword_sets  # noqa: E402
+
+FILLER = (
+    "best of the year playlist vibes for late nights and early mornings curated weekly "
+    "by the community featuring new artists remixes live sets and deep cuts"
+).split()
+
+
+def make_catalogue(n: int, vocabulary: Sequence[str], seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    catalogue = []
+    for i in range(n):
+        name_words = rng.sample(vocabulary, 2) + rng.sample(FILLER, 2)
+        rng.shuffle(name_words)
+        desc_words = rng.sample(FILLER, 12) + rng.sample(vocabulary, rng.randint(0, 3))
+        rng.shuffle(desc_words)
+        catalogue.append({
+            "id": f"pl{i:05d}",
+            "playlist_name": " ".join(w.title() for w in name_words),
+            "description": ("  ".join(desc_words) + "!\n") * rng.randint(1, 3),
+            "total_followers": int(rng.paretovariate(1.2) * 40),
+        })
+    return catalogue
+
+
+def make_requests(
+    catalogue: List[Dict[str, Any]], keyword_sets: List[List[str]], n: int, seed: int = 1
+) -> List[Tuple[List[Dict[str, Any]], List[str]]]:
+    rng = random.Random(seed)
+    weights = [1.0 / (i + 1) for i in range(len(catalogue))]  # a few playlists dominate results
+    requests = []
+    for _ in range(n):
+        picked = {p["id"]: p for p in rng.choices(catalogue, weights=weights, k=90)}
+        requests.append((list(picked.values()), rng.choice(keyword_sets)))
+    return requests
+
+
+def _tokenize(s: str) -> Set[str]:
+    s = re.sub(r"\s+", " ", (s or "").lower()).strip()
+    return set(re.findall(r"[a-z0-9]+", s))
+
+
+def reference_rank(playlists: Sequence[Dict[str, Any]], keywords: Sequence[str]) -> List[Dict[str, Any]]:
+    """rank_playlists as it was: tokenize everything, score, full sort."""
+    keyword_tokens: Set[str] = set()
+    for k in keywords:
+        keyword_tokens |= _tokenize(str(k))
+    ranked = []
+    for p in playlists:
+        text_tokens = _tokenize(f"{p.get('playlist_name') or ''} {p.get('description') or ''}")
+        score = len(keyword_tokens & text_tokens) * 10.0
+        score += min(float(p.get("total_followers") or 0) / 1000.0, 5.0)
+        ranked.append((score, p))
+    ranked.sort(key=lambda x: x[0], reverse=True)
+    return [p for _, p in ranked]
+
+
+def _best_of(repeat: int, fn) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(n: int, catalogue_size: int, repeat: int) -> None:
+    keyword_sets = [list(k) for k in enumerate_keyword_sets()]
+    vocabulary = sorted({t for ks in keyword_sets for k in ks for t in _tokenize(k)})
+    catalogue = make_catalogue(catalogue_size, vocabulary)
+    requests = make_requests(catalogue, keyword_sets, n)
+    limit = max(1, CANDIDATE_POOL_SIZE)
+
+    for playlists, keywords in requests:
+        if reference_rank(playlists, keywords)[:limit] != music.rank_playlists(playlists, keywords, limit=limit):
+            raise SystemExit("indexed and reference rankings differ")
+
+    reference = _best_of(repeat, lambda: [reference_rank(p, k)[:limit] for p, k in requests])
+    indexed = _best_of(repeat, lambda: [music.rank_playlists(p, k, limit=limit) for p, k in requests])
+
+    print(f"{n} ranking calls (~90 candidates, top {limit}), catalogue {catalogue_size}, best of {repeat}")
+    print(f"reference: {reference / n * 1e6:8.1f} us/call")
+    print(f"  indexed: {indexed / n * 1e6:8.1f} us/call")
+    print(f"speedup: {reference / indexed:.2f}x   index: {music._PLAYLIST_INDEX.snapshot()}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--catalogue", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    main(args.requests, args.catalogue, args.repeat)
@@ -0,0 +1,86 @@
+"""
+Benchmark: weather.compute_music_profile in a loop vs. weather_batch.compute_music_profiles.
+
+Generates synthetic OpenWeather payloads, checks both paths agree exactly, then
+reports throughput for each.
+
+    python benchmarks/bench_weather_batch.py --payloads 100000 --repeat 3
+"""
+from __future__ import annotations
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import weather_batch  # noqa: E402
+from profile_rules import active_rules  # noqa: E402
+from weather import compute_music_profile  # noqa: E402
+
+MAINS = ["Thunderstorm", "Rain", "Drizzle", "Snow", "Clear", "Clouds", "Mist", "Fog", "Haze", "Smoke", "Dust"]
+DESCRIPTIONS = ["light rain", "storm clouds", "clear sky", "overcast clouds", "freezing rain", "haze", ""]
+
+
+def make_payloads(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    payloads = []
+    for _ in range(n):
+        temp = rng.uniform(-30, 45)
+        payloads.append({
+            "weather": [{"main": rng.choice(MAINS), "description": rng.choice(DESCRIPTIONS)}],
+            "main": {
+                "temp": temp,
+                "feels_like": temp + rng.uniform(-8, 3),
+                "humidity": rng.randint(0, 100),
+                "pressure": rng.choice([990, 1004, 1013, 1030]),
+            },
+            "wind": {"speed": rng.uniform(0, 30), "gust": rng.uniform(0, 40)},
+            "clouds": {"all": rng.randint(0, 100)},
+            "visibility": rng.choice([500, 5000, 10000]),
+            "dt": rng.randint(1_700_000_000, 1_700_086_400),
+            "sys": {"sunrise": 1_700_020_000, "sunset": 1_700_060_000},
+        })
+    return payloads
+
+
+def _best_of(repeat: int, fn) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(n: int, repeat: int) -> None:
+    if weather_batch.np is None:
+        print("numpy is not installed; compute_music_profiles would just loop (pip install -r requirements-optional.txt)")
+        return
+
+    payloads = make_payloads(n)
+    if [compute_music_profile(p) for p in payloads] != weather_batch.compute_music_profiles(payloads):
+        raise SystemExit("batch and scalar results differ")
+
+    scalar = _best_of(repeat, lambda: [compute_music_profile(p) for p in payloads])
+    batch = _best_of(repeat, lambda: weather_batch.compute_music_profiles(payloads))
+    rules = active_rules()
+    parse = _best_of(repeat, lambda: weather_batch._columns(rules, payloads))
+    arrays = weather_batch._columns(rules, payloads)
+    scoring = _best_of(repeat, lambda: weather_batch.score_matrix(rules, arrays))
+
+    print(f"{n} payloads, best of {repeat} (results identical)")
+    print(f"  scalar: {scalar * 1000:8.1f} ms  {n / scalar:>10,.0f} payloads/s")
+    print(f"   batch: {batch * 1000:8.1f} ms  {n / batch:>10,.0f} payloads/s")
+    print(f"          of which parsing {parse * 1000:.1f} ms, array scoring {scoring * 1000:.1f} ms")
+    print(f"speedup: {scalar / batch:.2f}x")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--payloads", type=int, default=100_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    main(args.payloads, args.repeat)
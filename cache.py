@@ -0,0 +1,111 @@
+from __future__ import annotations
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+import deadline
+from singleflight import SingleFlight
+
+# Small in-process cache used in front of upstream APIs (Audius, OpenWeather).
+#
+#   age < ttl                  -> fresh hit, returned as-is
+#   ttl <= age < ttl + stale   -> stale hit, returned immediately + refreshed in the background
+#   older / missing            -> caller awaits the fetch, which runs in its own task: a
+#                                 caller that stops waiting (deadline, cancellation) still
+#                                 leaves the value cached once it arrives
+#
+# Size is bounded LRU-style: the least recently used entry is evicted first.
+
+
+def _now() -> float:
+    return time.monotonic()
+
+
+class TTLCache:
+    def __init__(self, ttl: float, max_entries: int = 512, stale_ttl: float = 0.0) -> None:
+        self.ttl = float(ttl)
+        self.stale_ttl = float(stale_ttl)
+        self.max_entries = max(1, int(max_entries))
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._refreshing: Set[Hashable] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._fills = SingleFlight()
+        self.stats: Dict[str, int] = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _lookup(self, key: Hashable) -> Tuple[Optional[Any], Optional[float]]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None, None
+        stored_at, value = entry
+        age = _now() - stored_at
+        if age >= self.ttl + self.stale_ttl:
+            del self._data[key]
+            return None, None
+        self._data.move_to_end(key)
+        return value, age
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns a fresh value or None (stale entries don't count here)."""
+        value, age = self._lookup(key)
+        if age is None or age >= self.ttl:
+            return None
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (_now(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        value, age = self._lookup(key)
+
+        if age is not None and age < self.ttl:
+            self.stats["hits"] += 1
+            return value
+
+        if age is not None:
+            # Serve stale right away, refresh once in the background
+            self.stats["stale_hits"] += 1
+            self._schedule_refresh(key, fetch)
+            return value
+
+        self.stats["misses"] += 1
+        return await self._fills.do(key, lambda: self._fill(key, fetch))
+
+    async def _fill(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        value = await fetch()
+        self.set(key, value)
+        return value
+
+    def _schedule_refresh(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def _refresh() -> None:
+            # Outlives the request that noticed the stale entry, so not bound by its budget
+            deadline.detach()
+            try:
+                self.set(key, await fetch())
+                self.stats["refreshes"] += 1
+            except Exception:
+                # Keep serving the stale value; the next stale hit retries
+                pass
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.ensure_future(_refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
@@ -0,0 +1,55 @@
+from __future__ import annotations
+import time
+from contextvars import ContextVar, Token
+from typing import Optional
+
+from fastapi import HTTPException
+
+from config import env_float
+
+# End-to-end time budget per request.
+#
+# RecommendationPipeline.run() sets an absolute deadline (time.monotonic) in a ContextVar,
+# so every upstream call underneath it (OpenWeather, Audius search/tracks) stops waiting
+# once it passes, without the deadline being threaded through each signature. Upstream
+# requests themselves are shared between callers (singleflight.py), so they keep their
+# default timeouts; only each caller's wait is bounded. Tasks started inside the run
+# inherit the deadline.
+
+REQUEST_BUDGET = env_float("REQUEST_BUDGET", 8.0)  # seconds; 0 disables the budget
+# Kept back from the search stage for ranking + the track fetch; once only this much is
+# left, search stops waiting and the pipeline ranks whatever results have arrived
+REQUEST_BUDGET_RESERVE = env_float("REQUEST_BUDGET_RESERVE", 2.0)
+
+_DEADLINE: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(HTTPException):
+    """The request's time budget ran out (not the upstream's fault, so no failover/penalty)."""
+
+    def __init__(self, detail: str = "Request time budget exhausted") -> None:
+        super().__init__(status_code=504, detail=detail)
+
+
+def deadline_in(seconds: float) -> Optional[float]:
+    """Absolute deadline `seconds` from now (None when seconds <= 0, i.e. no budget)."""
+    return time.monotonic() + seconds if seconds > 0 else None
+
+
+def enter(deadline: Optional[float]) -> Token:
+    return _DEADLINE.set(deadline)
+
+
+def leave(token: Token) -> None:
+    _DEADLINE.reset(token)
+
+
+def detach() -> None:
+    """Drop the deadline for the current task (background refreshes outlive the request)."""
+    _DEADLINE.set(None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current budget, or None without one."""
+    deadline = _DEADLINE.get()
+    return None if deadline is None else deadline - time.monotonic()
@@ -0,0 +1,211 @@
+from __future__ import annotations
+import bisect
+import math
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import APIRouter, HTTPException
+
+from cache import TTLCache
+from config import env_float, env_int
+from http_client import get_client
+from singleflight import SingleFlight
+from weather import WeatherResponse, geocode_city, mood_from_scores, weather_cell
+from weather_batch import compute_music_profiles
+
+# 5-day / 3-hour forecast -> bucket timeline per location.
+#
+# One forecast call returns 40 slots; they're all profiled in one pass and cached per
+# weather grid cell, so any `at=` inside the next five days is answered without
+# another upstream call. Forecasts refresh every 3 hours upstream; past the TTL the
+# cached timeline keeps being served while a background refresh runs.
+
+router = APIRouter(prefix="/api", tags=["forecast"])
+
+_FORECAST_URL = "https://api.openweathermap.org/data/2.5/forecast"
+
+FORECAST_SLOT = 3 * 60 * 60
+# `at` closer to now than this is answered from the current observation instead
+FORECAST_MIN_AHEAD = env_float("FORECAST_MIN_AHEAD", 90 * 60)
+# ... and so is `at` up to this far in the past (clock skew); anything older is a 400
+FORECAST_PAST_TOLERANCE = env_float("FORECAST_PAST_TOLERANCE", 10 * 60)
+
+_TIMELINE_CACHE = TTLCache(
+    ttl=env_float("FORECAST_CACHE_TTL", 60 * 60 * 3),
+    max_entries=env_int("FORECAST_CACHE_SIZE", 2048),
+    stale_ttl=env_float("FORECAST_CACHE_STALE", 60 * 60 * 24),
+)
+_FORECAST_FLIGHT = SingleFlight()
+
+
+def parse_at(value: Optional[str]) -> Optional[int]:
+    """
+    `at=` query value (unix seconds or ISO 8601, naive = UTC) -> unix seconds.
+    None means "now": both a missing value and one within FORECAST_MIN_AHEAD of now
+    (or FORECAST_PAST_TOLERANCE before it). Older times are a 400: there's no past weather.
+    """
+    if value is None or not value.strip():
+        return None
+    value = value.strip()
+    try:
+        at = float(value)
+    except ValueError:
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="at must be a unix timestamp or an ISO 8601 datetime")
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        at = parsed.timestamp()
+    if not math.isfinite(at):
+        raise HTTPException(status_code=400, detail="at must be a finite unix timestamp")
+
+    now = time.time()
+    if at < now - FORECAST_PAST_TOLERANCE:
+        raise HTTPException(status_code=400, detail="at is in the past")
+    if at <= now + FORECAST_MIN_AHEAD:
+        return None
+    return int(at)
+
+
+def slot_payloads(forecast_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Forecast list items reshaped like current-weather payloads, so compute_music_profile
+    scores them the same way. The city's sunrise/sunset are shifted to each slot's day;
+    without them the slot's day/night flag (sys.pod) decides.
+    """
+    city = forecast_json.get("city") or {}
+    name = city.get("name") or "Your location"
+    sunrise = int(city.get("sunrise") or 0)
+    sunset = int(city.get("sunset") or 0)
+
+    out = []
+    for item in forecast_json.get("list") or []:
+        dt = int(item.get("dt", 0))
+        if sunrise and sunset:
+            days = (dt - sunrise) // 86400
+            sun = {"sunrise": sunrise + days * 86400, "sunset": sunset + days * 86400}
+        elif (item.get("sys") or {}).get("pod") == "n":
+            sun = {"sunrise": dt + 1, "sunset": dt + 2}
+        else:
+            sun = {"sunrise": dt - 1, "sunset": dt + 1}
+        out.append({**item, "name": name, "sys": sun})
+    return out
+
+
+def build_timeline(forecast_json: Dict[str, Any]) -> Dict[str, Any]:
+    payloads = slot_payloads(forecast_json)
+    slots = []
+    for payload, profile in zip(payloads, compute_music_profiles(payloads)):
+        w0 = (payload.get("weather") or [{}])[0]
+        main_data = payload.get("main") or {}
+        slots.append({
+            "dt": int(payload.get("dt", 0)),
+            "description": str(w0.get("description") or w0.get("main") or "weather"),
+            "temperature": float(main_data.get("temp", 0.0)),
+            "humidity": int(main_data.get("humidity", 50)),
+            "wind_speed": float((payload.get("wind") or {}).get("speed", 0.0)),
+            "mood": mood_from_scores(profile["scores"]),
+            **profile,
+        })
+    slots.sort(key=lambda s: s["dt"])
+    return {"city": str((forecast_json.get("city") or {}).get("name") or "Your location"), "slots": slots}
+
+
+async def fetch_timeline(lat: float, lon: float, api_key: str) -> Dict[str, Any]:
+    """Profiled forecast timeline for a location, cached per weather grid cell."""
+    cell = weather_cell(lat, lon)
+
+    async def _fetch() -> Dict[str, Any]:
+        r = await get_client().get(
+            _FORECAST_URL,
+            params={
+                "lat": cell[0],
+                "lon": cell[1],
+                "appid": api_key,
+                "units": "metric",
+                "lang": "en",
+            },
+            timeout=12.0,
+        )
+        r.raise_for_status()
+        return build_timeline(r.json())
+
+    return await _TIMELINE_CACHE.get_or_fetch(cell, lambda: _FORECAST_FLIGHT.do(("forecast", cell), _fetch))
+
+
+def slot_at(timeline: Dict[str, Any], at: int) -> Optional[Dict[str, Any]]:
+    """The 3-hour slot covering `at` (or None when `at` is outside the forecast)."""
+    slots = timeline.get("slots") or []
+    if not slots:
+        return None
+    i = bisect.bisect_right([s["dt"] for s in slots], at) - 1
+    if i < 0:
+        # Before the first slot, but the first slot is the closest forecast we have
+        return slots[0] if slots[0]["dt"] - at < FORECAST_SLOT else None
+    if at - slots[i]["dt"] >= FORECAST_SLOT:
+        return None
+    return slots[i]
+
+
+def _api_key() -> str:
+    key = (os.getenv("OPENWEATHER_API_KEY") or "").strip()
+    if not key:
+        raise HTTPException(status_code=500, detail="OPENWEATHER_API_KEY is missing (env not loaded)")
+    return key
+
+
+async def _timeline_for(lat: float, lon: float, key: str) -> Dict[str, Any]:
+    try:
+        return await fetch_timeline(lat, lon, key)
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=502, detail=f"Forecast API error: {e.response.status_code}") from e
+    except (httpx.RequestError, ValueError) as e:
+        raise HTTPException(status_code=502, detail=f"Forecast request failed: {e!r}") from e
+
+
+async def get_weather_by_coords_at(lat: float, lon: float, at: int) -> WeatherResponse:
+    """Forecast weather (and profile) for coordinates at unix time `at`."""
+    timeline = await _timeline_for(lat, lon, _api_key())
+    slot = slot_at(timeline, at)
+    if slot is None:
+        raise HTTPException(status_code=400, detail="at is outside the 5-day forecast window")
+
+    return WeatherResponse(
+        lat=lat,
+        lon=lon,
+        city=timeline["city"],
+        description=slot["description"],
+        temperature=slot["temperature"],
+        humidity=slot["humidity"],
+        wind_speed=slot["wind_speed"],
+        mood=slot["mood"],
+        bucket=slot["bucket"],
+        keywords=list(slot["keywords"]),
+        scores=slot["scores"],
+        forecast_time=slot["dt"],
+    )
+
+
+async def get_weather_at(city_name: str, at: int) -> WeatherResponse:
+    """Forecast weather for a city at unix time `at` (geocoded like get_weather)."""
+    lat, lon = await geocode_city(city_name, _api_key())
+    return await get_weather_by_coords_at(lat, lon, at)
+
+
+@router.get("/forecast/{city_name}")
+async def get_forecast_timeline(city_name: str):
+    """Bucket timeline (one profiled entry per 3-hour slot) for the next five days."""
+    key = _api_key()
+    lat, lon = await geocode_city(city_name, key)
+    return {"lat": lat, "lon": lon, **await _timeline_for(lat, lon, key)}
+
+
+def upstream_stats() -> Dict[str, Any]:
+    return {
+        "coalescing": _FORECAST_FLIGHT.snapshot(),
+        "timeline_cache": {**_TIMELINE_CACHE.stats, "size": len(_TIMELINE_CACHE)},
+    }
@@ -0,0 +1,112 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+from cache import TTLCache
+from config import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+# City name -> (lat, lon). Coordinates don't move, so we keep them around for a long time:
+#   1) in-memory LRU (hot cities, no I/O)
+#   2) SQLite file on disk (survives restarts, shared by workers on the same host);
+#      best-effort: the first disk error (unwritable path, broken file) turns it off
+
+GEOCODE_CACHE_PATH = Path(
+    os.getenv("GEOCODE_CACHE_PATH") or (Path(__file__).resolve().parent / ".cache" / "geocode.sqlite3")
+)
+GEOCODE_CACHE_TTL = env_float("GEOCODE_CACHE_TTL", 60 * 60 * 24 * 30)  # 30 days
+GEOCODE_CACHE_SIZE = env_int("GEOCODE_CACHE_SIZE", 2048)
+
+Coords = Tuple[float, float]
+
+
+def normalize_city(name: str) -> str:
+    return re.sub(r"\s+", " ", (name or "").strip().lower())
+
+
+class GeoCache:
+    def __init__(self, path: Path = GEOCODE_CACHE_PATH, ttl: float = GEOCODE_CACHE_TTL, max_entries: int = GEOCODE_CACHE_SIZE) -> None:
+        self.path = Path(path)
+        self.ttl = ttl
+        self.memory = TTLCache(ttl=ttl, max_entries=max_entries)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.disk_enabled = True
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                " city TEXT PRIMARY KEY, lat REAL NOT NULL, lon REAL NOT NULL, stored_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _db_get(self, city: str) -> Optional[Coords]:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT lat, lon, stored_at FROM geocode WHERE city = ?", (city,)
+            ).fetchone()
+        if row is None or (time.time() - row[2]) >= self.ttl:
+            return None
+        return float(row[0]), float(row[1])
+
+    def _db_set(self, city: str, coords: Coords) -> None:
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT OR REPLACE INTO geocode (city, lat, lon, stored_at) VALUES (?, ?, ?, ?)",
+                (city, coords[0], coords[1], time.time()),
+            )
+            conn.commit()
+
+    def _disable_disk(self, exc: Exception) -> None:
+        if self.disk_enabled:
+            self.disk_enabled = False
+            logger.warning("Geocode disk cache at %s unavailable (%r); memory only from now on", self.path, exc)
+
+    async def get(self, city_name: str) -> Optional[Coords]:
+        city = normalize_city(city_name)
+        coords = self.memory.get(city)
+        if coords is not None or not self.disk_enabled:
+            return coords
+        try:
+            coords = await asyncio.to_thread(self._db_get, city)
+        except (sqlite3.Error, OSError) as e:
+            self._disable_disk(e)
+            return None
+        if coords is not None:
+            self.memory.set(city, coords)
+        return coords
+
+    async def set(self, city_name: str, coords: Coords) -> None:
+        city = normalize_city(city_name)
+        self.memory.set(city, coords)
+        if not self.disk_enabled:
+            return
+        try:
+            await asyncio.to_thread(self._db_set, city, coords)
+        except (sqlite3.Error, OSError) as e:
+            # Memory still has it
+            self._disable_disk(e)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+geocache = GeoCache()
@@ -0,0 +1,88 @@
+from __future__ import annotations
+import importlib.util
+import logging
+from typing import Optional
+
+import httpx
+
+from config import env_bool, env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+# One pooled client for every upstream call (OpenWeather + Audius).
+# Opened/closed by the FastAPI lifespan in app.py so keep-alive connections
+# survive between requests instead of paying a TCP+TLS handshake per call.
+
+UPSTREAM_TIMEOUT = env_float("UPSTREAM_TIMEOUT", 12.0)
+UPSTREAM_CONNECT_TIMEOUT = env_float("UPSTREAM_CONNECT_TIMEOUT", 5.0)
+UPSTREAM_MAX_CONNECTIONS = env_int("UPSTREAM_MAX_CONNECTIONS", 100)
+UPSTREAM_MAX_KEEPALIVE = env_int("UPSTREAM_MAX_KEEPALIVE", 20)
+UPSTREAM_KEEPALIVE_EXPIRY = env_float("UPSTREAM_KEEPALIVE_EXPIRY", 30.0)
+
+# Opt-in HTTP/2 (needs the `h2` package): the searches + track fetch of one mashup then
+# share a single multiplexed connection per host instead of one connection each.
+# Hosts that don't offer h2 in ALPN keep talking HTTP/1.1.
+UPSTREAM_HTTP2 = env_bool("UPSTREAM_HTTP2", False)
+
+_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def build_client(
+    timeout: float = UPSTREAM_TIMEOUT,
+    connect_timeout: float = UPSTREAM_CONNECT_TIMEOUT,
+    max_connections: int = UPSTREAM_MAX_CONNECTIONS,
+    max_keepalive: int = UPSTREAM_MAX_KEEPALIVE,
+    keepalive_expiry: float = UPSTREAM_KEEPALIVE_EXPIRY,
+    http2: bool = UPSTREAM_HTTP2,
+    http1: bool = True,
+) -> httpx.AsyncClient:
+    """
+    Creates a pooled AsyncClient with our limits and timeouts.
+    Callers can still override the timeout per request.
+    http1=False with http2=True speaks HTTP/2 with prior knowledge (cleartext h2c, e.g. local stand-ins).
+    """
+    if http2 and not http2_available():
+        logger.warning("UPSTREAM_HTTP2 is set but the h2 package is missing; using HTTP/1.1")
+        http2, http1 = False, True
+    return httpx.AsyncClient(
+        http1=http1,
+        http2=http2,
+        timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        follow_redirects=True,
+    )
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+async def start_client() -> httpx.AsyncClient:
+    """Open the shared client (called from the app lifespan)."""
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        _CLIENT = build_client()
+    return _CLIENT
+
+
+async def close_client() -> None:
+    """Close the shared client and drop its pooled connections."""
+    global _CLIENT
+    client, _CLIENT = _CLIENT, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Returns the shared client.
+    Falls back to creating one lazily, e.g. when a router is mounted without our lifespan.
+    """
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        _CLIENT = build_client()
+    return _CLIENT
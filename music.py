@@ -1,18 +1,25 @@
 from __future__ import annotations
+import asyncio
 import os
 import random
 import re
-import time
-from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from functools import lru_cache, partial
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
 
 import httpx
 from fastapi import APIRouter, HTTPException
 
+from cache import TTLCache
+from config import env_bool, env_float, env_int
+from http_client import get_client
+from playlist_index import PlaylistIndex
+from providers import ProviderPool
+from singleflight import SingleFlight
+from track_cache import TrackCache, Validators
+
 router = APIRouter(prefix="/api/music", tags=["music"])
 
-# Audius uses a network of “discovery providers”. We pick one and cache it.
-_DISCOVERY_PROVIDER: Optional[str] = None
-_DISCOVERY_PROVIDER_TS: float = 0.0
+# Audius uses a network of “discovery providers”. The list is cached and ranked by health.
 _DISCOVERY_TTL_SECONDS = 60 * 30  # refresh every 30 minutes
 
 APP_NAME = (os.getenv("AUDIUS_APP_NAME", "MoodWeather") or "MoodWeather").strip()
@@ -20,21 +27,46 @@ APP_NAME = (os.getenv("AUDIUS_APP_NAME", "MoodWeather") or "MoodWeather").strip(
 # A safe fallback if api.audius.co is flaky
 FALLBACK_PROVIDER = "https://discoveryprovider.audius.co"
 
+# Serve track audio through our caching proxy (audio_proxy.py) instead of straight from Audius
+AUDIO_PROXY = env_bool("AUDIO_PROXY", False)
+
+# How many playlist searches one request may have in flight at once
+SEARCH_CONCURRENCY = max(1, env_int("AUDIUS_SEARCH_CONCURRENCY", 4))
+
+# Coalesces identical in-flight GETs (same url + params) into one upstream call
+_HTTP_FLIGHT = SingleFlight()
+
+# Search results cache: keyword vocabulary is tiny, so the same queries repeat constantly
+_SEARCH_CACHE = TTLCache(
+    ttl=env_float("AUDIUS_SEARCH_CACHE_TTL", 300.0),
+    stale_ttl=env_float("AUDIUS_SEARCH_CACHE_STALE", 3600.0),
+    max_entries=env_int("AUDIUS_SEARCH_CACHE_SIZE", 512),
+)
+
+# Playlist tracks: shared by mashup, regenerate and the tracks endpoint; playlists rarely
+# change, so expired entries are revalidated (304) rather than refetched
+_TRACKS_CACHE = TrackCache(
+    ttl=env_float("AUDIUS_TRACKS_CACHE_TTL", 300.0),
+    max_bytes=env_int("AUDIUS_TRACKS_CACHE_BYTES", 32 << 20),
+    max_entries=env_int("AUDIUS_TRACKS_CACHE_SIZE", 1024),
+)
 
-def _now() -> float:
-    return time.time()
+
+async def _get_json(url: str, params: Optional[dict], timeout: float) -> dict:
+    r = await get_client().get(url, params=params, timeout=timeout)
+    r.raise_for_status()
+    return r.json()
 
 
 async def _http_get_json(url: str, params: Optional[dict] = None, timeout: float = 12.0) -> dict:
     """
     Small helper with sane error handling.
     If Audius has hiccups, we raise a useful HTTPException.
+    Identical concurrent GETs are coalesced into one upstream request.
     """
+    key = (url, tuple(sorted((params or {}).items())))
     try:
-        async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
-            r = await client.get(url, params=params)
-            r.raise_for_status()
-            return r.json()
+        return await _HTTP_FLIGHT.do(key, lambda: _get_json(url, params, timeout))
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=502, detail=f"Audius HTTP error: {e.response.status_code}") from e
     except (httpx.RequestError, ValueError) as e:
@@ -43,41 +75,62 @@ async def _http_get_json(url: str, params: Optional[dict] = None, timeout: float
 
 async def get_discovery_provider(force_refresh: bool = False) -> str:
     """
-    Returns a discovery provider base URL, cached.
-    Uses api.audius.co (official) to get a list, then picks one.
+    Returns the best discovery provider base URL right now.
+    The list comes from api.audius.co (cached); ranking comes from live latency/error stats.
     """
-    global _DISCOVERY_PROVIDER, _DISCOVERY_PROVIDER_TS
-
-    if not force_refresh and _DISCOVERY_PROVIDER and (_now() - _DISCOVERY_PROVIDER_TS) < _DISCOVERY_TTL_SECONDS:
-        return _DISCOVERY_PROVIDER
+    await provider_pool.refresh(force=force_refresh)
+    return await provider_pool.best()
+
+
+# Health-checked pool: every call goes to the best provider and fails over on errors
+provider_pool = ProviderPool(
+    fetch_json=_http_get_json,
+    fallback=FALLBACK_PROVIDER,
+    list_ttl=_DISCOVERY_TTL_SECONDS,
+    refresh_ahead=env_float("AUDIUS_DISCOVERY_REFRESH_AHEAD", 0.8),
+    probe_interval=env_float("AUDIUS_PROBE_INTERVAL", 30.0),
+    max_attempts=env_int("AUDIUS_MAX_ATTEMPTS", 3),
+    hedge=env_bool("AUDIUS_HEDGE", True),
+    hedge_percentile=env_float("AUDIUS_HEDGE_PERCENTILE", 95.0),
+    hedge_max_delay=env_float("AUDIUS_HEDGE_MAX_DELAY", 2.0),
+    breaker_failures=env_int("AUDIUS_BREAKER_FAILURES", 3),
+    breaker_cooldown=env_float("AUDIUS_BREAKER_COOLDOWN", 30.0),
+)
+
+
+def upstream_stats() -> Dict[str, Any]:
+    """Coalescing + cache counters for the Audius side (used by /api/debug/upstream)."""
+    return {
+        "coalescing": _HTTP_FLIGHT.snapshot(),
+        "search_cache": {**_SEARCH_CACHE.stats, "size": len(_SEARCH_CACHE)},
+        "tracks_cache": _TRACKS_CACHE.snapshot(),
+        "providers": provider_pool.snapshot(),
+        "playlist_index": _PLAYLIST_INDEX.snapshot(),
+    }
 
-    # Try official provider list
-    try:
-        data = await _http_get_json("https://api.audius.co")
-        providers = data.get("data") or []
-        urls = [p for p in providers if isinstance(p, str) and p.startswith("http")]
-        if not urls:
-            raise ValueError("No providers returned")
 
-        _DISCOVERY_PROVIDER = random.choice(urls).rstrip("/")
-        _DISCOVERY_PROVIDER_TS = _now()
-        return _DISCOVERY_PROVIDER
-    except Exception:
-        _DISCOVERY_PROVIDER = FALLBACK_PROVIDER.rstrip("/")
-        _DISCOVERY_PROVIDER_TS = _now()
-        return _DISCOVERY_PROVIDER
+_WHITESPACE_RE = re.compile(r"\s+")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
 
 
 def _normalize_text(s: str) -> str:
-    s = (s or "").lower()
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    return _WHITESPACE_RE.sub(" ", (s or "").lower()).strip()
 
 
 def _tokenize(s: str) -> Set[str]:
-    s = _normalize_text(s)
-    tokens = re.findall(r"[a-z0-9]+", s)
-    return set(tokens)
+    # Whitespace collapsing can't change [a-z0-9]+ tokens, so lowercasing is enough here
+    return set(_TOKEN_RE.findall((s or "").lower()))
+
+
+@lru_cache(maxsize=1024)
+def _keyword_tokens(keywords: Tuple[str, ...]) -> FrozenSet[str]:
+    """Tokens of a keyword list; the vocabulary is tiny, so these repeat constantly."""
+    return frozenset(t for k in keywords for t in _tokenize(k))
+
+
+# Every playlist we've ranked, by token, for posting-list scoring (see playlist_index.py).
+# Bounded LRU; an entry is only re-tokenized when its name/description hash changes.
+_PLAYLIST_INDEX = PlaylistIndex(_tokenize, max_entries=env_int("PLAYLIST_INDEX_SIZE", 20_000))
 
 
 def build_audius_queries(keywords: Sequence[str], max_queries: int = 6) -> List[str]:
@@ -111,28 +164,134 @@ def build_audius_queries(keywords: Sequence[str], max_queries: int = 6) -> List[
 async def get_audius_playlists(query: str, limit: int = 15) -> List[Dict[str, Any]]:
     """
     Search for playlists by keyword query.
+    Cached per normalized (query, limit); stale entries are served while refreshing in the background.
     """
-    provider = await get_discovery_provider()
-    url = f"{provider}/v1/playlists/search"
+    key = (_normalize_text(query), int(limit))
+    items = await _SEARCH_CACHE.get_or_fetch(key, lambda: _fetch_audius_playlists(key[0], key[1]))
+    return list(items)
 
-    data = await _http_get_json(
-        url,
+
+async def _fetch_audius_playlists(query: str, limit: int) -> List[Dict[str, Any]]:
+    data = await provider_pool.get_json(
+        "/v1/playlists/search",
         params={"query": query, "limit": int(limit), "app_name": APP_NAME},
     )
     items = data.get("data") or []
     return [x for x in items if isinstance(x, dict)]
 
 
+async def search_audius_playlists(
+    queries: Sequence[str],
+    limit: int = 15,
+    concurrency: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Runs several playlist searches concurrently (bounded by a semaphore) and merges them.
+    Results are de-duplicated by playlist id in query order, same as searching one by one.
+    """
+    playlists, _ = await search_audius_playlists_within(queries, limit=limit, concurrency=concurrency)
+    return playlists
+
+
+async def search_audius_playlists_within(
+    queries: Sequence[str],
+    limit: int = 15,
+    wait: Optional[float] = None,
+    concurrency: Optional[int] = None,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    search_audius_playlists, but waits at most `wait` seconds: queries still running then
+    are left to finish into the search cache and the results that did arrive are merged.
+    Returns (playlists, complete).
+    """
+    sem = asyncio.Semaphore(max(1, concurrency or SEARCH_CONCURRENCY))
+
+    async def _one(q: str) -> List[Dict[str, Any]]:
+        async with sem:
+            return await get_audius_playlists(q, limit=limit)
+
+    tasks = [asyncio.ensure_future(_one(q)) for q in queries]
+    if not tasks:
+        return [], True
+    try:
+        done, pending = await asyncio.wait(
+            tasks,
+            timeout=max(0.0, wait) if wait is not None else None,
+            return_when=asyncio.FIRST_EXCEPTION,
+        )
+        for t in done:
+            if t.exception() is not None:
+                raise t.exception()
+    finally:
+        for t in tasks:
+            t.cancel()
+
+    all_playlists: List[Dict[str, Any]] = []
+    dedup: Set[Any] = set()
+    for items in (t.result() for t in tasks if t in done):
+        for p in items:
+            pid = p.get("id")
+            if pid and pid not in dedup:
+                dedup.add(pid)
+                all_playlists.append(p)
+
+    return all_playlists, not pending
+
+
+async def get_audius_playlist(playlist_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Fetch a single playlist's metadata by id.
+    """
+    data = await provider_pool.get_json(f"/v1/playlists/{playlist_id}", params={"app_name": APP_NAME})
+    items = [x for x in (data.get("data") or []) if isinstance(x, dict)]
+    return items[0] if items else None
+
+
+async def _get_tracks_conditional(
+    url: str,
+    params: Optional[dict] = None,
+    timeout: float = 12.0,
+    validators: Optional[Validators] = None,
+) -> Tuple[Optional[List[Dict[str, Any]]], Validators, int]:
+    """
+    GET a playlist's tracks, conditionally when we hold validators.
+    Returns (tracks or None on 304, the response's validators, response size in bytes).
+    """
+    headers = {}
+    etag, last_modified = validators or (None, None)
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        r = await get_client().get(url, params=params, headers=headers, timeout=timeout)
+        fresh = (r.headers.get("etag"), r.headers.get("last-modified"))
+        if r.status_code == 304:
+            return None, fresh, 0
+        r.raise_for_status()
+        items = r.json().get("data") or []
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=502, detail=f"Audius HTTP error: {e.response.status_code}") from e
+    except (httpx.RequestError, ValueError, AttributeError) as e:
+        raise HTTPException(status_code=502, detail=f"Audius request failed: {e!r}") from e
+    return [x for x in items if isinstance(x, dict)], fresh, len(r.content)
+
+
 async def get_audius_playlist_tracks(playlist_id: str, limit: int = 25) -> List[Dict[str, Any]]:
     """
     Fetch playlist tracks. Returns track objects (including track id).
+    Cached per (playlist, limit); expired entries are revalidated with ETag / Last-Modified.
     """
-    provider = await get_discovery_provider()
-    url = f"{provider}/v1/playlists/{playlist_id}/tracks"
+    key = (str(playlist_id), int(limit))
 
-    data = await _http_get_json(url, params={"limit": int(limit), "app_name": APP_NAME})
-    items = data.get("data") or []
-    return [x for x in items if isinstance(x, dict)]
+    async def _fetch(validators: Optional[Validators]) -> Tuple[Optional[List[Dict[str, Any]]], Validators, int]:
+        return await provider_pool.get_json(
+            f"/v1/playlists/{playlist_id}/tracks",
+            params={"limit": int(limit), "app_name": APP_NAME},
+            fetch=partial(_get_tracks_conditional, validators=validators),
+        )
+
+    return list(await _TRACKS_CACHE.get_or_fetch(key, _fetch))
 
 
 def _pick_artwork_url(obj: Dict[str, Any]) -> Optional[str]:
@@ -152,6 +311,8 @@ def _pick_artwork_url(obj: Dict[str, Any]) -> Optional[str]:
 
 
 def _track_stream_url(provider: str, track_id: str) -> str:
+    if AUDIO_PROXY:
+        return f"/api/music/stream/{track_id}"
     return f"{provider}/v1/tracks/{track_id}/stream?app_name={APP_NAME}"
 
 
@@ -176,6 +337,20 @@ def to_track_payload(track: Dict[str, Any], provider: str) -> Dict[str, Any]:
     return payload
 
 
+def to_playlist_summary(playlist: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Minimal raw subset of a playlist (what to_playlist_payload needs).
+    Small enough to keep a ranked candidate pool next to each recommendation.
+    """
+    return {
+        "id": str(playlist.get("id")),
+        "playlist_name": playlist.get("playlist_name") or playlist.get("name") or "Unknown playlist",
+        "description": playlist.get("description") or "",
+        "permalink": playlist.get("permalink"),
+        "artwork": _pick_artwork_url(playlist),
+    }
+
+
 def to_playlist_payload(playlist: Dict[str, Any]) -> Dict[str, Any]:
     pid = playlist.get("id")
     name = playlist.get("playlist_name") or playlist.get("name") or "Unknown playlist"
@@ -212,22 +387,21 @@ def pick_random_playlist(playlists: Sequence[Dict[str, Any]], exclude_ids: Optio
     return random.choice(candidates) if candidates else None
 
 
-def _score_playlist(p: Dict[str, Any], keyword_tokens: Set[str]) -> float:
-    name = p.get("playlist_name") or p.get("name") or ""
-    desc = p.get("description") or ""
-
-    text_tokens = _tokenize(f"{name} {desc}")
-
-    matches = len(keyword_tokens.intersection(text_tokens))
-    score = matches * 10.0
-
-    followers = p.get("total_followers") or p.get("follow_count") or 0
-    try:
-        score += min(float(followers) / 1000.0, 5.0)
-    except Exception:
-        pass
+def rank_playlists(
+    playlists: Sequence[Dict[str, Any]],
+    keywords: Sequence[str],
+    exclude_ids: Optional[Set[str]] = None,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Candidate playlists, best match first (stable for equal scores).
+    With `limit`, only the top `limit` (heap selection, no full sort).
+    """
+    if not playlists:
+        return []
 
-    return score
+    keyword_tokens = _keyword_tokens(tuple(str(k) for k in keywords))
+    return _PLAYLIST_INDEX.rank(playlists, keyword_tokens, exclude_ids=exclude_ids, limit=limit)
 
 
 def pick_best_playlist(
@@ -235,29 +409,8 @@ def pick_best_playlist(
     keywords: Sequence[str],
     exclude_ids: Optional[Set[str]] = None,
 ) -> Optional[Dict[str, Any]]:
-    if not playlists:
-        return None
-
-    exclude_ids = exclude_ids or set()
-
-    keyword_tokens: Set[str] = set()
-    for k in keywords:
-        keyword_tokens |= _tokenize(str(k))
-
-    ranked: List[Tuple[float, Dict[str, Any]]] = []
-    for p in playlists:
-        pid = p.get("id")
-        if pid is None:
-            continue
-        if str(pid) in exclude_ids:
-            continue
-        ranked.append((_score_playlist(p, keyword_tokens), p))
-
-    if not ranked:
-        return None
-
-    ranked.sort(key=lambda x: x[0], reverse=True)
-    return ranked[0][1]
+    ranked = rank_playlists(playlists, keywords, exclude_ids=exclude_ids, limit=1)
+    return ranked[0] if ranked else None
 
 
 # ---------------------------
@@ -0,0 +1,292 @@
+from __future__ import annotations
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from fastapi import HTTPException
+
+from music import (
+    build_audius_queries,
+    get_audius_playlist_tracks,
+    get_audius_playlists,
+    get_audius_playlist,
+    get_discovery_provider,
+    pick_random_playlist,
+    rank_playlists,
+    search_audius_playlists_within,
+    to_track_payload,
+)
+import deadline
+from config import env_float, env_int
+from deadline import REQUEST_BUDGET, REQUEST_BUDGET_RESERVE, DeadlineExceeded
+from forecast import get_weather_at, get_weather_by_coords_at
+from weather import WeatherResponse, get_weather, get_weather_by_coords
+
+logger = logging.getLogger(__name__)
+
+# Ranked candidates kept with each recommendation so regenerate can skip searching
+CANDIDATE_POOL_SIZE = env_int("CANDIDATE_POOL_SIZE", 20)
+CANDIDATE_POOL_TTL = env_float("CANDIDATE_POOL_TTL", 60 * 30)
+
+# Keywords to fall back on when the weather profile produced none
+MOOD_KEYWORDS: Dict[str, List[str]] = {
+    "happy": ["sunny", "upbeat", "dance"],
+    "sad": ["lofi", "rain", "chill"],
+    "neutral": ["ambient", "peaceful", "instrumental"],
+}
+
+
+@dataclass
+class PipelineContext:
+    """Everything one recommendation run reads and writes, stage by stage."""
+
+    # Inputs (set one of location / coords, or preset keywords for regenerate)
+    location: Optional[str] = None
+    coords: Optional[Tuple[float, float]] = None
+    at: Optional[int] = None  # unix time to recommend for (forecast); None = now
+    keywords: List[str] = field(default_factory=list)
+    mood_query: Optional[str] = None
+    exclude_ids: Set[str] = field(default_factory=set)
+    pool: List[Dict[str, Any]] = field(default_factory=list)  # ranked candidates from an earlier run
+    pool_cursor: int = 0
+    deadline: Optional[float] = None  # time.monotonic() the whole run must finish by; None = pipeline budget
+
+    # Error wording differs slightly between mashup and regenerate
+    error_label: str = "Audius selection failed"
+    not_found_detail: str = "No playlist could be selected"
+
+    # Outputs
+    weather: Optional[WeatherResponse] = None
+    queries: List[str] = field(default_factory=list)
+    candidates: List[Dict[str, Any]] = field(default_factory=list)
+    ranked: List[Dict[str, Any]] = field(default_factory=list)
+    playlist: Optional[Dict[str, Any]] = None
+    from_pool: bool = False
+    raw_tracks: Optional[List[Dict[str, Any]]] = None  # prefetched by the warm index
+    tracks: List[Dict[str, Any]] = field(default_factory=list)
+    partial: bool = False  # budget ran out: ranked from the search results that had arrived, or no tracks
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def server_timing(self) -> str:
+        """Per-stage timings formatted for a Server-Timing response header."""
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in self.timings.items())
+
+
+Stage = Callable[["RecommendationPipeline", PipelineContext], Awaitable[None]]
+
+
+async def stage_weather(pipe: "RecommendationPipeline", ctx: PipelineContext) -> None:
+    if ctx.weather is not None:
+        return
+    if ctx.at is not None:
+        if ctx.coords is not None:
+            ctx.weather = await pipe.forecast_by_coords(*ctx.coords, ctx.at)
+        elif ctx.location is not None:
+            ctx.weather = await pipe.forecast_by_city(ctx.location, ctx.at)
+    elif ctx.coords is not None:
+        ctx.weather = await pipe.weather_by_coords(*ctx.coords)
+    elif ctx.location is not None:
+        ctx.weather = await pipe.weather_by_city(ctx.location)
+
+
+async def stage_keywords(pipe: "RecommendationPipeline", ctx: PipelineContext) -> None:
+    if ctx.keywords:
+        return
+    if ctx.weather is not None and ctx.weather.keywords:
+        ctx.keywords = list(ctx.weather.keywords)
+    else:
+        mood = ctx.weather.mood if ctx.weather is not None else "neutral"
+        ctx.keywords = list(MOOD_KEYWORDS.get(mood, ["chill"]))
+
+
+async def stage_queries(pipe: "RecommendationPipeline", ctx: PipelineContext) -> None:
+    ctx.queries = build_audius_queries(ctx.keywords, max_queries=pipe.max_queries)
+    if not ctx.mood_query:
+        ctx.mood_query = ctx.queries[0] if ctx.queries else "chill"
+
+
+async def stage_pool(pipe: "RecommendationPipeline", ctx: PipelineContext) -> None:
+    """Take the next unseen playlist from the cached ranked pool (no searching)."""
+    while ctx.pool_cursor < len(ctx.pool):
+        entry = ctx.pool[ctx.pool_cursor]
+        ctx.pool_cursor += 1
+        pid = str(entry.get("id"))
+        if pid in ctx.exclude_ids:
+            continue
+        if not entry.get("playlist_name"):
+            # Id-only pool (signed-token mode): one metadata lookup instead of a full search
+            try:
+                entry = await pipe.fetch_playlist(pid)
+            except DeadlineExceeded:
+                raise
+            except HTTPException as e:
+                # Removed or unreachable playlist: the next candidate will do
+                logger.info("pool playlist %s skipped: %s", pid, e.detail)
+                continue
+            if not entry:
+                continue
+        ctx.playlist = entry
+        ctx.from_pool = True
+        return
+
+
+async def stage_index(pipe: "RecommendationPipeline", ctx: PipelineContext) -> None:
+    """Serve ranking (and usually tracks) from the background-warmed index, if it has these keywords."""
+    if pipe.index is None or ctx.playlist is not None:
+        return
+    entry = pipe.index.lookup(ctx.keywords)
+    if entry is None:
+        return
+
+    ranked = entry["ranked"]
+    playlist = next((p for p in ranked if str(p.get("id")) not in ctx.exclude_ids), None)
+    if playlist is None:
+        return
+    ctx.ranked = ranked
+    ctx.playlist = playlist
+    if playlist is ranked[0]:
+        ctx.raw_tracks = entry["tracks"]
+
+
+async def stage_search(pipe: "RecommendationPipeline", ctx: PipelineContext) -> None:
+    if ctx.playlist is not None:
+        return
+    # Leave the reserve for rank + tracks; searches still running then are dropped.
+    # Always wait a moment, so searches answered from the cache still count.
+    left = deadline.remaining()
+    wait = max(0.05, left - pipe.budget_reserve) if left is not None else None
+    ctx.candidates, complete = await pipe.search(ctx.queries, limit=pipe.search_limit, wait=wait)
+    ctx.partial = ctx.partial or not complete
+
+
+async def stage_rank(pipe: "RecommendationPipeline", ctx: PipelineContext) -> None:
+    if ctx.playlist is not None:
+        return
+    # Only the top of the ranking is ever used (the pick + the pool kept for regenerate)
+    ctx.ranked = rank_playlists(
+        ctx.candidates, ctx.keywords, exclude_ids=ctx.exclude_ids, limit=max(1, CANDIDATE_POOL_SIZE)
+    )
+    playlist = ctx.ranked[0] if ctx.ranked else None
+    if not playlist:
+        # Fallback: random pick from the plain mood query, still avoiding repeats
+        fallback = await pipe.search_one(ctx.mood_query or "chill", limit=pipe.search_limit)
+        playlist = pick_random_playlist(fallback, exclude_ids=ctx.exclude_ids)
+
+    if not playlist:
+        raise HTTPException(status_code=404, detail=ctx.not_found_detail)
+
+    ctx.playlist = playlist
+
+
+async def stage_tracks(pipe: "RecommendationPipeline", ctx: PipelineContext) -> None:
+    playlist_id = (ctx.playlist or {}).get("id")
+    try:
+        provider = await pipe.discovery()
+        tracks_raw = ctx.raw_tracks
+        if tracks_raw is None:
+            tracks_raw = await pipe.fetch_tracks(str(playlist_id), limit=pipe.track_limit)
+    except DeadlineExceeded:
+        # Out of budget with a playlist already picked: return it without its tracks
+        ctx.tracks = []
+        ctx.partial = True
+        return
+    ctx.tracks = [to_track_payload(t, provider) for t in tracks_raw]
+
+
+# Weather half (per location) and music half (shareable by locations with the same keywords)
+WEATHER_STAGES: List[Tuple[str, Stage]] = [
+    ("weather", stage_weather),
+    ("keywords", stage_keywords),
+]
+
+MUSIC_STAGES: List[Tuple[str, Stage]] = [
+    ("queries", stage_queries),
+    ("index", stage_index),
+    ("search", stage_search),
+    ("rank", stage_rank),
+    ("tracks", stage_tracks),
+]
+
+MASHUP_STAGES: List[Tuple[str, Stage]] = WEATHER_STAGES + MUSIC_STAGES
+
+# Regenerate already knows its keywords, so it skips the weather lookup and
+# tries the cached candidate pool before searching again
+REGENERATE_STAGES: List[Tuple[str, Stage]] = [("pool", stage_pool), ("keywords", stage_keywords)] + MUSIC_STAGES
+
+
+class RecommendationPipeline:
+    """
+    weather → keywords → queries → search → rank → tracks, as one reusable object.
+
+    Upstream providers are injected so the pipeline can run offline against stubs,
+    and every stage is timed into ctx.timings (milliseconds).
+    """
+
+    def __init__(
+        self,
+        weather_by_city: Callable[[str], Awaitable[WeatherResponse]] = get_weather,
+        weather_by_coords: Callable[[float, float], Awaitable[WeatherResponse]] = get_weather_by_coords,
+        forecast_by_city: Callable[[str, int], Awaitable[WeatherResponse]] = get_weather_at,
+        forecast_by_coords: Callable[[float, float, int], Awaitable[WeatherResponse]] = get_weather_by_coords_at,
+        search: Callable[..., Awaitable[Tuple[List[Dict[str, Any]], bool]]] = search_audius_playlists_within,
+        search_one: Callable[..., Awaitable[List[Dict[str, Any]]]] = get_audius_playlists,
+        fetch_tracks: Callable[..., Awaitable[List[Dict[str, Any]]]] = get_audius_playlist_tracks,
+        fetch_playlist: Callable[[str], Awaitable[Optional[Dict[str, Any]]]] = get_audius_playlist,
+        discovery: Callable[[], Awaitable[str]] = get_discovery_provider,
+        index: Optional[Any] = None,
+        max_queries: int = 6,
+        search_limit: int = 15,
+        track_limit: int = 25,
+        budget: float = REQUEST_BUDGET,
+        budget_reserve: float = REQUEST_BUDGET_RESERVE,
+    ) -> None:
+        self.weather_by_city = weather_by_city
+        self.weather_by_coords = weather_by_coords
+        self.forecast_by_city = forecast_by_city
+        self.forecast_by_coords = forecast_by_coords
+        self.search = search
+        self.search_one = search_one
+        self.fetch_tracks = fetch_tracks
+        self.fetch_playlist = fetch_playlist
+        self.index = index  # warm_index.BucketIndex (or anything with .lookup(keywords))
+        self.discovery = discovery
+        self.max_queries = max_queries
+        self.search_limit = search_limit
+        self.track_limit = track_limit
+        self.budget = budget  # seconds per run (0 = unbounded)
+        self.budget_reserve = budget_reserve
+
+    async def run(
+        self,
+        ctx: PipelineContext,
+        stages: Optional[Sequence[Tuple[str, Stage]]] = None,
+        on_stage: Optional[Callable[[str, PipelineContext], Awaitable[None]]] = None,
+    ) -> PipelineContext:
+        """
+        Run `stages` in order; `on_stage(name, ctx)` is awaited after each one (progressive responses).
+        Every upstream call underneath is bounded by ctx.deadline (see deadline.py).
+        """
+        if ctx.deadline is None:
+            ctx.deadline = deadline.deadline_in(self.budget)
+        token = deadline.enter(ctx.deadline)
+        try:
+            for name, stage in (stages if stages is not None else MASHUP_STAGES):
+                t0 = time.perf_counter()
+                try:
+                    await stage(self, ctx)
+                except HTTPException:
+                    raise
+                except Exception as e:
+                    if name == "weather":
+                        raise HTTPException(status_code=500, detail=str(e)) from e
+                    raise HTTPException(status_code=500, detail=f"{ctx.error_label}: {e!r}") from e
+                finally:
+                    ctx.timings[name] = (time.perf_counter() - t0) * 1000.0
+                if on_stage is not None:
+                    await on_stage(name, ctx)
+        finally:
+            deadline.leave(token)
+
+        logger.debug("pipeline timings: %s", ctx.server_timing())
+        return ctx
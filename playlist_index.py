@@ -0,0 +1,127 @@
+from __future__ import annotations
+import heapq
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+# Token -> playlist inverted index used for ranking.
+#
+# Every playlist we rank is tokenized once, keyed by id plus a hash of its name and
+# description: it is re-tokenized only when that text changes, while a follower-count
+# change just refreshes the precomputed follower boost. Ranking then counts
+# keyword hits by walking posting lists restricted to the candidate ids, and takes the
+# top k with a heap instead of sorting everything. Size is bounded LRU-style.
+
+Entry = Tuple[int, Any, FrozenSet[str], float]  # (text hash, followers, tokens, follower boost)
+
+
+def _text(p: Dict[str, Any]) -> str:
+    name = p.get("playlist_name") or p.get("name") or ""
+    desc = p.get("description") or ""
+    return f"{name} {desc}"
+
+
+def _follower_boost(followers: Any) -> float:
+    try:
+        return min(float(followers) / 1000.0, 5.0)
+    except Exception:
+        return 0.0
+
+
+class PlaylistIndex:
+    def __init__(self, tokenize: Callable[[str], Set[str]], max_entries: int = 20_000) -> None:
+        self.tokenize = tokenize
+        self.max_entries = max(1, int(max_entries))
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()
+        self._postings: Dict[str, Set[str]] = {}
+        self.stats: Dict[str, int] = {"indexed": 0, "reindexed": 0, "boost_updates": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _unlink(self, pid: str, tokens: Iterable[str]) -> None:
+        for t in tokens:
+            posting = self._postings.get(t)
+            if posting is not None:
+                posting.discard(pid)
+                if not posting:
+                    del self._postings[t]
+
+    def add(self, p: Dict[str, Any]) -> Entry:
+        """Index (or refresh) one playlist; returns its entry."""
+        pid = str(p.get("id"))
+        text = _text(p)
+        text_hash = hash(text)
+        followers = p.get("total_followers") or p.get("follow_count") or 0
+        entry = self._entries.get(pid)
+        if entry is not None and entry[0] == text_hash:
+            self._entries.move_to_end(pid)
+            if entry[1] != followers:
+                entry = (text_hash, followers, entry[2], _follower_boost(followers))
+                self._entries[pid] = entry
+                self.stats["boost_updates"] += 1
+            return entry
+
+        if entry is not None:
+            self._unlink(pid, entry[2])
+            self.stats["reindexed"] += 1
+        else:
+            self.stats["indexed"] += 1
+
+        tokens = frozenset(self.tokenize(text))
+        entry = (text_hash, followers, tokens, _follower_boost(followers))
+        self._entries[pid] = entry
+        self._entries.move_to_end(pid)
+        for t in tokens:
+            self._postings.setdefault(t, set()).add(pid)
+        return entry
+
+    def _trim(self) -> None:
+        while len(self._entries) > self.max_entries:
+            pid, entry = self._entries.popitem(last=False)
+            self._unlink(pid, entry[2])
+            self.stats["evictions"] += 1
+
+    def rank(
+        self,
+        playlists: Iterable[Dict[str, Any]],
+        keyword_tokens: Iterable[str],
+        exclude_ids: Optional[Set[str]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Candidates best match first: 10 points per keyword token in name/description,
+        plus up to 5 for followers. Equal scores keep the input order.
+        """
+        exclude_ids = exclude_ids or set()
+        candidates: List[Tuple[int, str, float, Dict[str, Any]]] = []
+        for pos, p in enumerate(playlists):
+            pid = p.get("id")
+            if pid is None or str(pid) in exclude_ids:
+                continue
+            candidates.append((pos, str(pid), self.add(p)[3], p))
+        if not candidates:
+            return []
+
+        # Keyword hits per candidate: intersect each posting list with the candidate ids,
+        # walking whichever side is smaller
+        ids = {pid for _, pid, _, _ in candidates}
+        hits: Dict[str, int] = {}
+        for t in keyword_tokens:
+            posting = self._postings.get(t)
+            if not posting:
+                continue
+            matched = [pid for pid in posting if pid in ids] if len(posting) < len(ids) else [pid for pid in ids if pid in posting]
+            for pid in matched:
+                hits[pid] = hits.get(pid, 0) + 1
+
+        scored = [(-(hits.get(pid, 0) * 10.0 + boost), pos, p) for pos, pid, boost, p in candidates]
+        self._trim()
+
+        if limit is not None and limit < len(scored):
+            top = heapq.nsmallest(max(0, limit), scored, key=lambda x: (x[0], x[1]))
+        else:
+            top = sorted(scored, key=lambda x: (x[0], x[1]))
+        return [p for _, _, p in top]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self._entries), "tokens": len(self._postings)}
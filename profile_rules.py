@@ -0,0 +1,621 @@
+from __future__ import annotations
+import json
+import logging
+import operator
+import os
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from config import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+# Weather -> music profile rules, as data.
+#
+# DEFAULT_RULES is the built-in table. PROFILE_RULES_PATH can point at a JSON file of
+# the same shape; it's re-read when it changes (checked at most every
+# PROFILE_RULES_CHECK_INTERVAL seconds), and a broken file keeps the previous rules.
+# A table is checked and prepared once into a RuleSet (conditions -> predicates, deltas ->
+# per-dim tuples); a broken table fails there, with a message naming the bad entry.
+#
+# Conditions, evaluated against observation_features (plus `derived` flags, plus the
+# capped scores for bucket rules):
+#   {"main_has": [...]} / {"desc_has": [...]}   substring of weather main / description
+#   {"flag": name}                              truthy value
+#   {"lt" | "le" | "gt" | "ge": [name, number]} numeric comparison (False for non-numbers)
+#   {"any": [...]} / {"all": [...]} / {"not": cond}
+
+PROFILE_RULES_PATH = os.getenv("PROFILE_RULES_PATH") or None
+PROFILE_RULES_CHECK_INTERVAL = env_float("PROFILE_RULES_CHECK_INTERVAL", 5.0)
+
+DEFAULT_RULES: Dict[str, Any] = {
+    "dims": ["energy", "brightness", "cozy", "intensity", "focus"],
+    "base": 50,
+    "cap": [0, 100],
+    "derived": {
+        "rainy": {"any": [{"main_has": ["rain", "drizzle"]}, {"desc_has": ["rain"]}]},
+    },
+    # Categorical influence: the first matching category applies
+    "categories": [
+        {"when": {"main_has": ["thunder", "storm"]}, "delta": {"intensity": 35, "brightness": -30, "energy": 5, "focus": -10, "cozy": 10}},
+        {"when": {"main_has": ["rain", "drizzle"]}, "delta": {"cozy": 25, "brightness": -25, "energy": -15, "intensity": 10, "focus": 15}},
+        {"when": {"main_has": ["snow"]}, "delta": {"cozy": 15, "energy": -20, "brightness": 5, "focus": 15}},
+        {"when": {"main_has": ["clear"]}, "delta": {"energy": 20, "brightness": 30, "intensity": -10, "focus": 5, "cozy": -5}},
+        {"when": {"main_has": ["cloud"]}, "delta": {"brightness": -15, "cozy": 10, "focus": 10, "energy": -5}},
+        {"when": {"main_has": ["mist", "fog", "haze", "smoke"]}, "delta": {"brightness": -20, "focus": 20, "energy": -10, "cozy": 10}},
+    ],
+    # Continuous modifiers: dim += round(weight * feature), or (1 - feature) with "invert"
+    "modifiers": [
+        {"feature": "comfort", "dim": "energy", "weight": 15},
+        {"feature": "comfort", "dim": "brightness", "weight": 12},
+        {"feature": "comfort", "invert": True, "dim": "cozy", "weight": 10},
+        {"feature": "cloud_n", "dim": "brightness", "weight": -30},
+        {"feature": "cloud_n", "dim": "cozy", "weight": 10},
+        {"feature": "cloud_n", "dim": "focus", "weight": 8},
+        {"feature": "hum_n", "dim": "cozy", "weight": 15},
+        {"feature": "hum_n", "dim": "focus", "weight": 6},
+        {"feature": "hum_n", "dim": "brightness", "weight": -10},
+        {"feature": "wind_n", "dim": "intensity", "weight": 25},
+        {"feature": "gust_n", "dim": "intensity", "weight": 10},
+        {"feature": "wind_n", "dim": "focus", "weight": -10},
+        {"feature": "vis_n", "invert": True, "dim": "focus", "weight": 12},
+        {"feature": "vis_n", "invert": True, "dim": "brightness", "weight": -8},
+    ],
+    # Flat deltas; every matching adjustment applies
+    "adjustments": [
+        {"when": {"flag": "is_night"}, "delta": {"brightness": -15, "focus": 10, "cozy": 10, "energy": -5}},
+        # Light heuristic: low pressure can feel "stormy"
+        {"when": {"lt": ["pressure", 1005]}, "delta": {"intensity": 5}},
+    ],
+    # "How positive does it feel": weighted sum of (uncapped) dims and features, summed in order
+    "valence": {
+        "terms": [
+            {"dim": "brightness", "weight": 0.55},
+            {"dim": "energy", "weight": 0.25},
+            {"feature": "comfort", "weight": 0.20, "scale": 100},
+            {"dim": "intensity", "weight": -0.35},
+        ],
+        "adjustments": [{"when": {"flag": "is_night"}, "add": -8}],
+    },
+    # First matching bucket wins; otherwise "<top>_<second>" of the scores
+    "buckets": [
+        {"name": "storm_intense", "when": {"any": [{"main_has": ["thunder"]}, {"desc_has": ["storm"]}]}},
+        {"name": "night_chill", "when": {"all": [{"flag": "is_night"}, {"lt": ["energy", 55]}]}},
+    ],
+    # Bucket (or score dim, for top-2 buckets) -> search keywords.
+    # "summer" stays out of brightness; the context rules add it for warm daylight.
+    "keywords": {
+        "energy": ["upbeat", "dance", "workout", "house", "pop"],
+        "brightness": ["happy", "feel good", "sunny", "uplifting", "bright"],
+        "cozy": ["cozy", "lofi", "acoustic", "coffeehouse", "warm"],
+        "intensity": ["cinematic", "dark", "intense", "dramatic", "bass"],
+        "focus": ["focus", "study", "ambient", "instrumental", "chill"],
+        "storm_intense": ["storm", "cinematic", "dark", "intense", "ambient"],
+        "night_chill": ["night", "late night", "chill", "synthwave", "ambient"],
+    },
+    # Context keywords (avoid "summer vibes" in freezing/dark weather): each group adds
+    # the words of its first matching rule
+    "context_keywords": [
+        [
+            {"when": {"le": ["feels_like", 8.0]}, "add": ["winter", "cold", "cozy"]},
+            {
+                "when": {"all": [{"ge": ["feels_like", 22.0]}, {"not": {"flag": "is_night"}}, {"lt": ["cloud_n", 0.5]}]},
+                "add": ["summer", "sunshine"],
+            },
+        ],
+        [{"when": {"flag": "is_night"}, "add": ["night", "late night"]}],
+        [{"when": {"ge": ["cloud_n", 0.8]}, "add": ["overcast", "moody"]}],
+        [{"when": {"flag": "rainy"}, "add": ["rainy day", "lofi beats"]}],
+    ],
+}
+
+# Condition operators (weather_batch applies the same ones to whole columns)
+COMPARISONS: Dict[str, Callable[[Any, Any], bool]] = {
+    "lt": operator.lt,
+    "le": operator.le,
+    "gt": operator.gt,
+    "ge": operator.ge,
+}
+TEXT_FIELDS = {"main_has": "main", "desc_has": "desc"}
+
+# A prepared condition: view (observation features, plus the scores for bucket rules) -> bool
+Predicate = Callable[[Dict[str, Any]], bool]
+# What's left of a condition once main/desc are known: True, False, or a function of
+# (observation features, scores so far) whose result is true or false
+Residual = Callable[[Dict[str, Any], Dict[str, int]], Any]
+
+# Distinct (main, desc) pairs profile() keeps a plan for (OpenWeather has a few dozen)
+PROFILE_PLAN_CACHE_SIZE = env_int("PROFILE_PLAN_CACHE_SIZE", 1024)
+
+
+def _either(a: Residual, b: Residual) -> Residual:
+    return lambda obs, scores: a(obs, scores) or b(obs, scores)
+
+
+def _both(a: Residual, b: Residual) -> Residual:
+    return lambda obs, scores: a(obs, scores) and b(obs, scores)
+
+
+class _Plan(NamedTuple):
+    """The rules with main/desc (and the derived flags that only use them) already applied."""
+    start: Tuple[Any, ...]                  # base + category + adjustments that always match
+    categories: Tuple[Tuple[Optional[Residual], Tuple[Tuple[int, Any], ...]], ...]
+    adjustments: Tuple[Tuple[Residual, Tuple[Tuple[int, Any], ...]], ...]
+    valence_adjustments: Tuple[Tuple[Optional[Residual], Any], ...]
+    buckets: Tuple[Tuple[int, Optional[Residual]], ...]
+    choice: Tuple[int, ...]                 # context picks, for the groups already settled
+    context: Tuple[Tuple[int, Tuple[Tuple[int, Optional[Residual]], ...]], ...]   # the other groups
+
+
+def _number(value: Any, what: str) -> Any:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{what} must be a number, got {value!r}")
+    return value
+
+
+def _top_two(scores: Dict[str, int]) -> Tuple[str, str]:
+    """Names of the two highest scores; ties go to the earlier name, as a stable sort would."""
+    items = iter(scores.items())
+    (first, a), (second, b) = next(items), next(items)
+    if b > a:
+        first, a, second, b = second, b, first, a
+    for name, v in items:
+        if v > a:
+            first, a, second, b = name, v, first, a
+        elif v > b:
+            second, b = name, v
+    return first, second
+
+
+class RuleSet:
+    """
+    A rule table, checked and prepared once: conditions become predicates, deltas become
+    tuples in dims order. profile(obs) goes further and folds the rules per weather
+    main/description (see _plan), so a call is a short loop over what's left.
+    """
+
+    def __init__(self, table: Dict[str, Any]) -> None:
+        self.table = table
+        self.dims: Tuple[str, ...] = tuple(str(d) for d in table["dims"])
+        self.score_names: Tuple[str, ...] = self.dims + ("valence",)
+        self.keyword_map: Dict[str, List[str]] = {k: list(v) for k, v in (table.get("keywords") or {}).items()}
+        self._keyword_memo: Dict[Tuple[Any, ...], List[str]] = {}
+        self._plans: Dict[Tuple[str, str], _Plan] = {}
+        # (bucket rule, top-2, context choice) -> (bucket, keywords), for profile()
+        self._resolved: Dict[Tuple[Any, ...], Tuple[str, List[str]]] = {}
+        self._index = {d: i for i, d in enumerate(self.dims)}
+
+        self.base = _number(table.get("base", 50), "base")
+        self.cap: Tuple[Any, Any] = tuple(_number(x, "cap") for x in table.get("cap", (0, 100)))
+        # (name, condition, predicate): flags computed from other values (each may use the ones before it)
+        self.derived: List[Tuple[str, Dict[str, Any], Predicate]] = [
+            (str(k), c, self.predicate(c)) for k, c in (table.get("derived") or {}).items()
+        ]
+
+        # (condition, predicate, delta) per category; the first match applies
+        self.categories = [(r["when"], self.predicate(r["when"]), self._delta(r["delta"])) for r in table.get("categories") or []]
+        # (feature, invert, dim index, weight): dim += round(weight * feature), or (1 - feature)
+        self.modifiers: List[Tuple[str, bool, int, Any]] = [
+            (str(m["feature"]), bool(m.get("invert")), self._dim(m["dim"]), _number(m["weight"], "weight"))
+            for m in table.get("modifiers") or []
+        ]
+        # The same as (feature, dim index, weight), split by invert for profile()
+        self._plain_modifiers = tuple((f, i, w) for f, invert, i, w in self.modifiers if not invert)
+        self._inverted_modifiers = tuple((f, i, w) for f, invert, i, w in self.modifiers if invert)
+        # (condition, predicate, delta); every match applies
+        self.adjustments = [(r["when"], self.predicate(r["when"]), self._delta(r["delta"])) for r in table.get("adjustments") or []]
+
+        valence = table.get("valence") or {}
+        # (dim index or None, feature or None, weight, scale or None), summed left to right
+        self.valence_terms: List[Tuple[Optional[int], Optional[str], Any, Any]] = []
+        for t in valence.get("terms") or []:
+            scale = _number(t["scale"], "scale") if t.get("scale") is not None else None
+            if "dim" in t:
+                self.valence_terms.append((self._dim(t["dim"]), None, _number(t["weight"], "weight"), scale))
+            else:
+                self.valence_terms.append((None, str(t["feature"]), _number(t["weight"], "weight"), scale))
+        if not self.valence_terms:
+            raise ValueError("valence needs at least one term")
+        self.valence_adjustments = [
+            (r["when"], self.predicate(r["when"]), _number(r["add"], "add")) for r in valence.get("adjustments") or []
+        ]
+
+        # (name, condition, predicate); buckets also see the capped scores under their names
+        self.buckets = [(str(r["name"]), r["when"], self.predicate(r["when"])) for r in table.get("buckets") or []]
+        self.bucket_names: List[str] = [name for name, _, _ in self.buckets]
+
+        # Per group: (condition, predicate, words); each group adds the words of its first match
+        self.context_rules: List[List[Tuple[Dict[str, Any], Predicate, Tuple[str, ...]]]] = [
+            [(r["when"], self.predicate(r["when"]), tuple(r["add"])) for r in group]
+            for group in table.get("context_keywords") or []
+        ]
+        self.context_keywords: List[List[Tuple[str, ...]]] = [[words for _, _, words in group] for group in self.context_rules]
+
+    # ---------------------------
+    # Preparing the table
+    # ---------------------------
+
+    def _dim(self, dim: Any) -> int:
+        if dim not in self._index:
+            raise ValueError(f"Unknown dim {dim!r}")
+        return self._index[dim]
+
+    def _delta(self, spec: Dict[str, Any]) -> Tuple[int, ...]:
+        out = [0] * len(self.dims)
+        for dim, amount in spec.items():
+            out[self._dim(dim)] += _number(amount, "delta")
+        return tuple(out)
+
+    def with_derived(self, view: Dict[str, Any]) -> Dict[str, Any]:
+        """`view` plus the derived flags it doesn't carry yet (predicates expect them there)."""
+        missing = [(name, when) for name, _, when in self.derived if view.get(name) is None]
+        if not missing:
+            return view
+        view = dict(view)
+        for name, when in missing:
+            view[name] = when(view)
+        return view
+
+    def predicate(self, cond: Dict[str, Any]) -> Predicate:
+        """Condition (see the top of this module) -> function of the view."""
+        if not isinstance(cond, dict) or len(cond) != 1:
+            raise ValueError(f"Condition must be a single-key object: {cond!r}")
+        (op, arg), = cond.items()
+
+        if op in TEXT_FIELDS:
+            field, needles = TEXT_FIELDS[op], tuple(str(n) for n in arg)
+
+            def _has(view: Dict[str, Any]) -> bool:
+                text = view.get(field) or ""
+                for n in needles:
+                    if n in text:
+                        return True
+                return False
+
+            return _has
+        if op == "flag":
+            name = str(arg)
+            return lambda view: bool(view.get(name))
+        if op in COMPARISONS:
+            (name, bound), compare = arg, COMPARISONS[op]
+            name, bound = str(name), _number(bound, "bound")
+
+            def _compare(view: Dict[str, Any]) -> bool:
+                v = view.get(name)
+                return isinstance(v, (int, float)) and compare(v, bound)
+
+            return _compare
+        if op in ("any", "all"):
+            parts = [self.predicate(c) for c in arg]
+            want = op == "any"
+
+            def _combine(view: Dict[str, Any]) -> bool:
+                for p in parts:
+                    if p(view) is want:
+                        return want
+                return not want
+
+            return _combine
+        if op == "not":
+            inner = self.predicate(arg)
+            return lambda view: not inner(view)
+        raise ValueError(f"Unknown condition {op!r}")
+
+    def context_samples(self) -> Dict[str, List[Any]]:
+        """
+        Per value the context keyword conditions look at, a few samples that between
+        them reach every outcome: both flag states, each substring (and none), and for
+        numbers each bound plus a point below, between and above them.
+        """
+        bounds: Dict[str, set] = {}
+        samples: Dict[str, Dict[Any, None]] = {}
+
+        def _walk(cond: Dict[str, Any]) -> None:
+            (op, arg), = cond.items()
+            if op in ("any", "all"):
+                for c in arg:
+                    _walk(c)
+            elif op == "not":
+                _walk(arg)
+            elif op == "flag":
+                samples.setdefault(str(arg), {False: None, True: None})
+            elif op in TEXT_FIELDS:
+                samples.setdefault(TEXT_FIELDS[op], {"": None}).update(dict.fromkeys(str(n) for n in arg))
+            else:
+                bounds.setdefault(str(arg[0]), set()).add(arg[1])
+
+        for group in self.context_rules:
+            for cond, _, _ in group:
+                _walk(cond)
+
+        out = {name: list(values) for name, values in samples.items()}
+        for name, bs in bounds.items():
+            bs = sorted(bs)
+            points = [bs[0] - 1.0]
+            for lo, hi in zip(bs, bs[1:]):
+                points += [lo, (lo + hi) / 2.0]
+            out[name] = points + [bs[-1], bs[-1] + 1.0]
+        return out
+
+    def _fold(self, cond: Dict[str, Any], text: Dict[str, str], flags: Dict[str, Any], scored: bool) -> Any:
+        """
+        Condition with main/desc (`text`) and the derived flags (`flags`: name -> folded
+        condition) substituted: True, False or a Residual (whose result only counts for its
+        truth). With `scored`, score names read the scores, as they shadow the observation
+        in bucket views.
+        """
+        (op, arg), = cond.items()
+        if op in TEXT_FIELDS:
+            value = text[TEXT_FIELDS[op]]
+            return any(str(n) in value for n in arg)
+        if op in ("any", "all"):
+            want = op == "any"
+            parts = []
+            for c in arg:
+                p = self._fold(c, text, flags, scored)
+                if p is want:
+                    return want
+                if p is not (not want):
+                    parts.append(p)
+            if not parts:
+                return not want
+            # Right to left into nested pairs: a or (b or c), short-circuiting like the predicates
+            combined = parts.pop()
+            while parts:
+                combined = (_either if want else _both)(parts.pop(), combined)
+            return combined
+        if op == "not":
+            inner = self._fold(arg, text, flags, scored)
+            if isinstance(inner, bool):
+                return not inner
+            return lambda obs, scores: not inner(obs, scores)
+
+        name = str(arg) if op == "flag" else str(arg[0])
+        if scored and name in self.score_names:
+            if op == "flag":
+                return lambda obs, scores: scores[name]
+            compare, bound = COMPARISONS[op], arg[1]
+            return lambda obs, scores: compare(scores[name], bound)
+        if name in flags:
+            flag = flags[name]
+            if op == "flag":
+                return flag
+            compare, bound = COMPARISONS[op], arg[1]
+            if isinstance(flag, bool):
+                return compare(flag, bound)
+            return lambda obs, scores: compare(bool(flag(obs, scores)), bound)
+        if op == "flag":
+            return lambda obs, scores: obs.get(name)
+        compare, bound = COMPARISONS[op], arg[1]
+
+        def _compare(obs: Dict[str, Any], scores: Dict[str, int]) -> bool:
+            v = obs.get(name)
+            return isinstance(v, (int, float)) and compare(v, bound)
+
+        return _compare
+
+    def _plan(self, main: str, desc: str) -> _Plan:
+        """The rules folded for one (main, desc); see profile()."""
+        text = {"main": main, "desc": desc}
+        flags: Dict[str, Any] = {}
+        for name, cond, _ in self.derived:
+            flags[name] = self._fold(cond, text, flags, False)
+
+        def _sparse(delta: Tuple[Any, ...]) -> Tuple[Tuple[int, Any], ...]:
+            return tuple((i, amount) for i, amount in enumerate(delta) if amount)
+
+        def _first(rules: List[Tuple[Any, Any]], scored: bool = False) -> Tuple[Tuple[Any, Any], ...]:
+            # (cond, value) -> (residual or None for "always", value), up to the first sure match
+            out = []
+            for cond, value in rules:
+                when = self._fold(cond, text, flags, scored)
+                if when is True:
+                    out.append((None, value))
+                    break
+                if when is not False:
+                    out.append((when, value))
+            return tuple(out)
+
+        start = [self.base] * len(self.dims)
+        categories = _first([(cond, _sparse(delta)) for cond, _, delta in self.categories])
+        if categories and categories[0][0] is None:
+            for i, amount in categories[0][1]:
+                start[i] += amount
+            categories = ()
+        adjustments = []
+        for cond, _, delta in self.adjustments:
+            when = self._fold(cond, text, flags, False)
+            if when is True:
+                start = [a + b for a, b in zip(start, delta)]
+            elif when is not False:
+                adjustments.append((when, _sparse(delta)))
+        valence_adjustments = []
+        for cond, _, add in self.valence_adjustments:
+            when = self._fold(cond, text, flags, False)
+            if when is not False:
+                valence_adjustments.append((None if when is True else when, add))
+
+        buckets = _first([(cond, i) for i, (_, cond, _) in enumerate(self.buckets)], scored=True)
+        choice = []
+        context = []
+        for g, group in enumerate(self.context_rules):
+            rules = _first([(cond, i) for i, (cond, _, _) in enumerate(group)])
+            if rules and rules[0][0] is None:
+                choice.append(rules[0][1])
+            else:
+                choice.append(-1)
+                if rules:
+                    context.append((g, tuple((i, when) for when, i in rules)))
+        return _Plan(
+            start=tuple(start),
+            categories=categories,
+            adjustments=tuple(adjustments),
+            valence_adjustments=tuple(valence_adjustments),
+            buckets=tuple((i, when) for when, i in buckets),
+            choice=tuple(choice),
+            context=tuple(context),
+        )
+
+    # ---------------------------
+    # Evaluating
+    # ---------------------------
+
+    def profile(self, obs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        observation_features(...) -> {"scores", "bucket", "keywords"}.
+
+        The rules are folded once per distinct (main, desc) into a _Plan: text conditions,
+        and derived flags built only from them, are settled there, so a call only runs
+        the modifiers and whatever conditions look at numbers or flags. Derived flags are
+        always computed from the observation.
+        """
+        key = (obs.get("main") or "", obs.get("desc") or "")
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._plan(*key)
+            if len(self._plans) < PROFILE_PLAN_CACHE_SIZE:
+                self._plans[key] = plan
+
+        scores: Dict[str, int] = {}
+        get = obs.get
+        d = list(plan.start)
+        for when, delta in plan.categories:
+            if when is None or when(obs, scores):
+                for i, amount in delta:
+                    d[i] += amount
+                break
+        for feature, i, weight in self._plain_modifiers:
+            d[i] += round(weight * get(feature))
+        for feature, i, weight in self._inverted_modifiers:
+            d[i] += round(weight * (1.0 - get(feature)))
+        for when, delta in plan.adjustments:
+            if when(obs, scores):
+                for i, amount in delta:
+                    d[i] += amount
+
+        rv = None
+        for i, feature, weight, scale in self.valence_terms:
+            term = weight * (d[i] if i is not None else get(feature))
+            if scale is not None:
+                term = term * scale
+            rv = term if rv is None else rv + term
+        for when, add in plan.valence_adjustments:
+            if when is None or when(obs, scores):
+                rv += add
+
+        lo, hi = self.cap
+        for name, v in zip(self.dims, d):
+            scores[name] = int(v if lo <= v <= hi else (lo if v < lo else hi))
+        v = int(round(rv))
+        scores["valence"] = int(v if lo <= v <= hi else (lo if v < lo else hi))
+
+        top_dims = _top_two(scores)
+        rule = -1
+        for i, when in plan.buckets:
+            if when is None or when(obs, scores):
+                rule = i
+                break
+        choice = plan.choice
+        if plan.context:
+            choice = list(choice)
+            for g, group in plan.context:
+                for i, when in group:
+                    if when is None or when(obs, scores):
+                        choice[g] = i
+                        break
+            choice = tuple(choice)
+        key = (rule, top_dims, choice)
+        resolved = self._resolved.get(key)
+        if resolved is None:
+            bucket = self.bucket_name(rule, top_dims)
+            resolved = self._resolved[key] = (bucket, self.keywords_for(bucket, top_dims, choice))
+        return {"scores": scores, "bucket": resolved[0], "keywords": resolved[1][:]}
+
+    def _bucket_rule(self, view: Dict[str, Any]) -> int:
+        for i, (_, _, when) in enumerate(self.buckets):
+            if when(view):
+                return i
+        return -1
+
+    def _choice(self, view: Dict[str, Any]) -> Tuple[int, ...]:
+        out = []
+        for group in self.context_rules:
+            pick = -1
+            for i, (_, when, _) in enumerate(group):
+                if when(view):
+                    pick = i
+                    break
+            out.append(pick)
+        return tuple(out)
+
+    def bucket_rule(self, obs: Dict[str, Any], scores: Dict[str, int]) -> int:
+        """Index of the first matching bucket rule, -1 for a top-2 bucket."""
+        return self._bucket_rule({**self.with_derived(obs), **scores})
+
+    def choice(self, view: Dict[str, Any]) -> Tuple[int, ...]:
+        """Index of the first matching rule per context keyword group (-1 for none)."""
+        return self._choice(self.with_derived(view))
+
+    def bucket_name(self, rule: int, top_dims: Sequence[str]) -> str:
+        return self.bucket_names[rule] if rule >= 0 else f"{top_dims[0]}_{top_dims[1]}"
+
+    def keywords_for(self, bucket: str, top_dims: Tuple[str, ...], choice: Tuple[int, ...]) -> List[str]:
+        """Keywords for a bucket + context choice (the index picked in each context group)."""
+        key = (bucket, top_dims, choice)
+        cached = self._keyword_memo.get(key)
+        if cached is None:
+            if bucket in self.keyword_map:
+                words = list(self.keyword_map[bucket])
+            else:
+                words = [w for d in top_dims for w in self.keyword_map.get(d, [])]
+            for group, i in zip(self.context_keywords, choice):
+                if i >= 0:
+                    words.extend(group[i])
+            # de-dupe while preserving order
+            cached = self._keyword_memo[key] = list(dict.fromkeys(words))
+        return cached[:]
+
+    def keywords(self, bucket: str, top_dims: Sequence[str], view: Dict[str, Any]) -> List[str]:
+        """Search keywords for a bucket, given the context values the keyword rules look at."""
+        return self.keywords_for(bucket, tuple(top_dims), self.choice(view))
+
+
+def load_rules(path: str) -> RuleSet:
+    with open(path, "r", encoding="utf-8") as f:
+        return RuleSet(json.load(f))
+
+
+_ACTIVE = RuleSet(DEFAULT_RULES)
+_loaded_mtime: Optional[float] = None
+_next_check = 0.0
+
+
+def set_rules(rules: RuleSet) -> None:
+    """Swap the active rule set (e.g. one built from a dict at runtime)."""
+    global _ACTIVE
+    _ACTIVE = rules
+
+
+def active_rules() -> RuleSet:
+    """The current rule set, picking up changes to PROFILE_RULES_PATH."""
+    global _loaded_mtime, _next_check
+    if PROFILE_RULES_PATH is None:
+        return _ACTIVE
+
+    now = time.monotonic()
+    if now >= _next_check:
+        _next_check = now + PROFILE_RULES_CHECK_INTERVAL
+        try:
+            mtime = os.stat(PROFILE_RULES_PATH).st_mtime
+            if mtime != _loaded_mtime:
+                _loaded_mtime = mtime
+                set_rules(load_rules(PROFILE_RULES_PATH))
+                logger.info("profile rules loaded from %s", PROFILE_RULES_PATH)
+        except Exception as e:
+            logger.warning("profile rules at %s not loaded, keeping the current ones: %r", PROFILE_RULES_PATH, e)
+    return _ACTIVE
+
+
+if __name__ == "__main__":
+    # Dump the built-in table as a starting point for PROFILE_RULES_PATH
+    print(json.dumps(DEFAULT_RULES, indent=2, ensure_ascii=False))
@@ -0,0 +1,429 @@
+from __future__ import annotations
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+import httpx
+from fastapi import HTTPException
+
+import deadline
+from deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# Audius discovery provider pool.
+#
+# Every provider gets an EWMA of latency and error rate, fed by real calls and by a
+# background /health_check probe. Calls go to the best healthy provider and fail
+# over to the next one on network errors / 5xx.
+#
+# Hedging: a call that hasn't answered within the rolling p95 of recent call latencies
+# gets a duplicate on the next provider; whichever answers first wins, the other is
+# cancelled. Circuit breaker: after `breaker_failures` consecutive failures a provider
+# gets no traffic for `breaker_cooldown` seconds, then one trial call (or a passing
+# probe) decides whether it closes again.
+
+FetchJson = Callable[..., Awaitable[dict]]
+
+
+class ProviderStats:
+    __slots__ = ("latency", "error_rate", "samples", "last_ok", "tiebreak", "failures", "open_until", "trial")
+
+    def __init__(self) -> None:
+        self.latency: Optional[float] = None  # seconds, EWMA
+        self.error_rate: float = 0.0           # 0..1, EWMA
+        self.samples: int = 0
+        self.last_ok: float = 0.0
+        self.tiebreak: float = random.random()  # spreads load across unprobed providers
+        self.failures: int = 0                 # consecutive, for the circuit breaker
+        self.open_until: float = 0.0           # breaker open (no traffic) until this time
+        self.trial: bool = False               # half-open trial call in flight
+
+    def breaker_state(self, now: Optional[float] = None) -> str:
+        if not self.open_until:
+            return "closed"
+        return "open" if (now or time.time()) < self.open_until else "half_open"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "latency_ms": round(self.latency * 1000.0, 1) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "samples": self.samples,
+            "breaker": self.breaker_state(),
+        }
+
+
+def _is_provider_fault(exc: BaseException) -> bool:
+    """
+    Network errors, 5xx and 429 say something about the host; other 4xx are about our request,
+    and a used-up request budget is about neither.
+    """
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    cause = exc.__cause__ if isinstance(exc, HTTPException) else exc
+    if isinstance(cause, httpx.HTTPStatusError):
+        code = cause.response.status_code
+        return code >= 500 or code == 429
+    return True
+
+
+class ProviderPool:
+    def __init__(
+        self,
+        fetch_json: FetchJson,
+        list_url: str = "https://api.audius.co",
+        fallback: Optional[str] = None,
+        list_ttl: float = 60 * 30,
+        refresh_ahead: float = 0.8,
+        probe_interval: float = 30.0,
+        probe_timeout: float = 3.0,
+        probe_path: str = "/health_check",
+        alpha: float = 0.3,
+        max_attempts: int = 3,
+        unhealthy_error_rate: float = 0.5,
+        default_latency: float = 0.5,
+        hedge: bool = True,
+        hedge_percentile: float = 95.0,
+        hedge_window: int = 200,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 0.05,
+        hedge_max_delay: float = 2.0,
+        breaker_failures: int = 3,
+        breaker_cooldown: float = 30.0,
+    ) -> None:
+        self.fetch_json = fetch_json
+        self.list_url = list_url
+        self.fallback = fallback.rstrip("/") if fallback else None
+        self.list_ttl = list_ttl
+        self.refresh_ahead = refresh_ahead
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.probe_path = probe_path
+        self.alpha = alpha
+        self.max_attempts = max(1, max_attempts)
+        self.unhealthy_error_rate = unhealthy_error_rate
+        self.default_latency = default_latency
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = max(1, hedge_min_samples)
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.breaker_failures = max(1, breaker_failures)
+        self.breaker_cooldown = breaker_cooldown
+
+        # Latencies of recent successful calls (all providers), for the hedge delay
+        self._latencies: Deque[float] = deque(maxlen=max(1, hedge_window))
+        self.stats: Dict[str, int] = {"calls": 0, "hedged": 0, "hedge_wins": 0, "breaker_opens": 0}
+
+        self.providers: Dict[str, ProviderStats] = {}
+        self.list_ts: float = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------------------------
+    # Provider list
+    # ---------------------------
+
+    def _refresh_due(self) -> bool:
+        return (time.time() - self.list_ts) >= self.list_ttl * self.refresh_ahead
+
+    def set_providers(self, urls: List[str]) -> None:
+        """Replace the provider list, keeping stats for hosts we already know."""
+        fresh: Dict[str, ProviderStats] = {}
+        for u in urls:
+            u = u.rstrip("/")
+            fresh[u] = self.providers.get(u) or ProviderStats()
+        self.providers = fresh
+        self.list_ts = time.time()
+
+    async def _load_list(self) -> None:
+        try:
+            data = await self.fetch_json(self.list_url)
+            urls = [p for p in (data.get("data") or []) if isinstance(p, str) and p.startswith("http")]
+            if not urls:
+                raise ValueError("No providers returned")
+            self.set_providers(urls)
+        except Exception:
+            if self.fallback:
+                self.set_providers([self.fallback])
+
+    async def refresh(self, force: bool = False) -> List[str]:
+        """
+        Returns the provider list. Once we have one, callers never wait on discovery:
+        past `refresh_ahead` of the TTL it is reloaded in the background instead.
+        Only the very first load (or a forced one) blocks, and only one coroutine does it.
+        """
+        if not force and self.providers:
+            if self._refresh_due():
+                self._schedule_refresh()
+            return list(self.providers)
+
+        seen_ts = self.list_ts
+        async with self._lock:
+            # Someone else refreshed while we waited for the lock
+            if self.list_ts != seen_ts and self.providers:
+                return list(self.providers)
+            await self._load_list()
+        return list(self.providers)
+
+    def _schedule_refresh(self) -> None:
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+
+        async def _refresh() -> None:
+            deadline.detach()
+            async with self._lock:
+                if self._refresh_due():
+                    await self._load_list()
+
+        self._refresh_task = asyncio.ensure_future(_refresh())
+
+    # ---------------------------
+    # Scoring
+    # ---------------------------
+
+    def record(self, provider: str, ok: bool, latency: Optional[float] = None) -> None:
+        st = self.providers.get(provider)
+        if st is None:
+            return
+        a = self.alpha
+        st.samples += 1
+        st.error_rate = (1 - a) * st.error_rate + a * (0.0 if ok else 1.0)
+        if ok:
+            st.last_ok = time.time()
+            if latency is not None:
+                self._record_latency(st, latency)
+        self._update_breaker(provider, st, ok)
+
+    def _record_latency(self, st: ProviderStats, latency: float) -> None:
+        a = self.alpha
+        st.latency = latency if st.latency is None else (1 - a) * st.latency + a * latency
+
+    def _update_breaker(self, provider: str, st: ProviderStats, ok: bool) -> None:
+        now = time.time()
+        state = st.breaker_state(now)
+        if ok:
+            st.failures = 0
+            if state == "half_open":
+                st.open_until = 0.0
+                logger.info("Audius provider %s recovered, closing its circuit breaker", provider)
+            return
+
+        st.failures += 1
+        if state == "half_open" or (state == "closed" and st.failures >= self.breaker_failures):
+            st.open_until = now + self.breaker_cooldown
+            self.stats["breaker_opens"] += 1
+            logger.warning("Audius provider %s failing, circuit open for %.0fs", provider, self.breaker_cooldown)
+
+    def is_available(self, provider: str) -> bool:
+        """False while the provider's circuit breaker is open (unknown hosts, e.g. the fallback, always pass)."""
+        st = self.providers.get(provider)
+        return st is None or st.breaker_state() != "open"
+
+    def _claim(self, provider: str) -> bool:
+        """Whether a call may go to `provider` now; a half-open breaker lets exactly one trial through."""
+        st = self.providers.get(provider)
+        if st is None:
+            return True
+        state = st.breaker_state()
+        if state == "open":
+            return False
+        if state == "half_open":
+            if st.trial:
+                return False
+            st.trial = True
+        return True
+
+    def hedge_delay(self) -> float:
+        """Rolling p95 of recent call latencies, clamped; the max until there are enough samples."""
+        if len(self._latencies) < self.hedge_min_samples:
+            return self.hedge_max_delay
+        ordered = sorted(self._latencies)
+        p = ordered[min(len(ordered) - 1, int(self.hedge_percentile / 100.0 * (len(ordered) - 1)))]
+        return max(self.hedge_min_delay, min(self.hedge_max_delay, p))
+
+    def _score(self, st: ProviderStats) -> float:
+        latency = st.latency if st.latency is not None else self.default_latency
+        return latency * (1.0 + 4.0 * st.error_rate)
+
+    def is_healthy(self, provider: str) -> bool:
+        st = self.providers.get(provider)
+        return st is not None and st.error_rate < self.unhealthy_error_rate
+
+    def ranked(self) -> List[str]:
+        """
+        Healthy providers first (fastest first), then unhealthy ones as a last resort.
+        Providers with an open circuit breaker are left out.
+        """
+        order = sorted(
+            ((u, st) for u, st in self.providers.items() if self.is_available(u)),
+            key=lambda kv: (not self.is_healthy(kv[0]), self._score(kv[1]), kv[1].tiebreak),
+        )
+        urls = [u for u, _ in order]
+        if self.fallback and self.fallback not in urls:
+            urls.append(self.fallback)
+        return urls
+
+    async def best(self) -> str:
+        await self.refresh()
+        ranked = self.ranked()
+        if not ranked:
+            raise HTTPException(status_code=502, detail="No Audius discovery provider available")
+        return ranked[0]
+
+    # ---------------------------
+    # Calls with failover
+    # ---------------------------
+
+    async def get_json(
+        self,
+        path: str,
+        params: Optional[dict] = None,
+        timeout: float = 12.0,
+        fetch: Optional[Callable[..., Awaitable[Any]]] = None,
+    ) -> Any:
+        """
+        GET `path` on the best provider; on provider errors retry on the next best.
+        If the call is slower than hedge_delay(), a duplicate goes to the next provider
+        and the first answer wins (at most max_attempts calls in total).
+        `fetch` replaces fetch_json for this call (same signature, e.g. a conditional GET).
+        """
+        fetch = fetch or self.fetch_json
+        await self.refresh()
+        self.stats["calls"] += 1
+        queue = self.ranked()[: self.max_attempts]
+        delay = self.hedge_delay() if self.hedge else None
+        pending: Dict[asyncio.Task, str] = {}
+        started: Dict[asyncio.Task, float] = {}
+        hedges: Set[asyncio.Task] = set()
+        last_exc: Optional[BaseException] = None
+        won = False
+
+        def _launch(hedge: bool = False) -> bool:
+            while queue:
+                provider = queue.pop(0)
+                if not self._claim(provider):
+                    continue
+                task = asyncio.ensure_future(self._attempt(fetch, provider, path, params, timeout))
+                pending[task] = provider
+                started[task] = time.perf_counter()
+                if hedge:
+                    hedges.add(task)
+                    self.stats["hedged"] += 1
+                return True
+            return False
+
+        _launch()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=delay if queue else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    # Slower than usual: hedge on the next provider, keep waiting on both
+                    _launch(hedge=True)
+                    continue
+
+                for task in done:
+                    provider = pending.pop(task)
+                    exc = task.exception()
+                    if exc is None:
+                        if task in hedges:
+                            self.stats["hedge_wins"] += 1
+                        won = True
+                        return task.result()
+                    if not _is_provider_fault(exc):
+                        raise exc
+                    last_exc = exc
+                    logger.info("Audius provider %s failed (%r), failing over", provider, exc)
+                if not pending:
+                    _launch()
+        finally:
+            now = time.perf_counter()
+            for task, provider in pending.items():
+                task.cancel()
+                st = self.providers.get(provider)
+                if won and st is not None:
+                    # Lost the race: at least this slow, so let the latency EWMA see it
+                    self._record_latency(st, now - started[task])
+
+        if last_exc is not None:
+            raise last_exc
+        raise HTTPException(status_code=502, detail="No Audius discovery provider available")
+
+    async def _attempt(
+        self,
+        fetch: Callable[..., Awaitable[Any]],
+        provider: str,
+        path: str,
+        params: Optional[dict],
+        timeout: float,
+    ) -> Any:
+        t0 = time.perf_counter()
+        try:
+            data = await fetch(f"{provider}{path}", params=params, timeout=timeout)
+        except Exception as e:
+            if _is_provider_fault(e):
+                self.record(provider, ok=False)
+            raise
+        finally:
+            st = self.providers.get(provider)
+            if st is not None:
+                st.trial = False
+        latency = time.perf_counter() - t0
+        self._latencies.append(latency)
+        self.record(provider, ok=True, latency=latency)
+        return data
+
+    # ---------------------------
+    # Background probing
+    # ---------------------------
+
+    async def probe(self, provider: str) -> None:
+        t0 = time.perf_counter()
+        try:
+            await self.fetch_json(f"{provider}{self.probe_path}", timeout=self.probe_timeout)
+        except Exception:
+            self.record(provider, ok=False)
+            return
+        self.record(provider, ok=True, latency=time.perf_counter() - t0)
+
+    async def probe_all(self) -> None:
+        await self.refresh()
+        await asyncio.gather(*(self.probe(p) for p in list(self.providers)), return_exceptions=True)
+
+    async def _probe_loop(self) -> None:
+        while True:
+            try:
+                await self.probe_all()
+            except Exception:
+                logger.exception("Audius provider probe failed")
+            await asyncio.sleep(self.probe_interval)
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._probe_loop())
+
+    async def stop(self) -> None:
+        tasks = [t for t in (self._task, self._refresh_task) if t is not None]
+        self._task = self._refresh_task = None
+        for task in tasks:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "hedge_delay_ms": round(self.hedge_delay() * 1000.0, 1) if self.hedge else None,
+            "ranked": self.ranked(),
+            "providers": {u: st.as_dict() for u, st in self.providers.items()},
+        }
@@ -0,0 +1,64 @@
+from __future__ import annotations
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+import deadline
+from deadline import DeadlineExceeded
+
+# Request coalescing ("singleflight"): while a call for `key` is in flight, identical
+# calls wait on the same future instead of sending their own upstream request.
+#
+# The shared call belongs to no single caller, so it runs without a request deadline
+# (upstream calls inside it use their default timeouts). Each caller bounds only its
+# own wait by whatever is left of its budget.
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.stats: Dict[str, int] = {"calls": 0, "executed": 0, "coalesced": 0}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.stats["calls"] += 1
+        left = deadline.remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded()
+
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["executed"] += 1
+            # Run in its own task so a cancelled caller doesn't cancel everyone waiting on it
+            fut = asyncio.ensure_future(_detached(fn))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _f, k=key: self._forget(k, _f))
+
+        if left is None:
+            return await asyncio.shield(fut)
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), left)
+        except asyncio.TimeoutError:
+            if fut.done():
+                raise  # the shared call itself raised TimeoutError
+            raise DeadlineExceeded() from None
+
+    def _forget(self, key: Hashable, fut: asyncio.Future) -> None:
+        if self._inflight.get(key) is fut:
+            del self._inflight[key]
+        # Mark the exception as retrieved if every waiter went away
+        if not fut.cancelled():
+            fut.exception()
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "in_flight": self.in_flight}
+
+
+async def _detached(fn: Callable[[], Awaitable[Any]]) -> Any:
+    # The task has its own copy of the context, so this only affects the shared call
+    deadline.detach()
+    return await fn()
@@ -0,0 +1,215 @@
+from __future__ import annotations
+import abc
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from config import env_float, env_int
+
+# Recommendation state (what /api/recommend/regenerate needs to pick a new playlist).
+#
+# Values are small JSON dicts. Both backends expire entries after a TTL, evict the
+# least recently used ones when over max_entries / max_bytes, and count bytes as the
+# size of the JSON encoding.
+#
+#   memory  -> per-process, fastest (single worker)
+#   sqlite  -> WAL file shared by every worker on the same host
+
+STATE_STORE_BACKEND = (os.getenv("STATE_STORE_BACKEND") or "memory").strip().lower()
+STATE_STORE_PATH = Path(
+    os.getenv("STATE_STORE_PATH") or (Path(__file__).resolve().parent / ".cache" / "state.sqlite3")
+)
+STATE_TTL = env_float("STATE_TTL", 60 * 60 * 6)  # 6 hours
+STATE_MAX_ENTRIES = env_int("STATE_MAX_ENTRIES", 50_000)
+STATE_MAX_BYTES = env_int("STATE_MAX_BYTES", 64 * 1024 * 1024)
+
+
+def _encode(value: Dict[str, Any]) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+class StateStore(abc.ABC):
+    """Interface shared by the backends. All methods are async so app code doesn't care which one runs."""
+
+    def __init__(self, ttl: float = STATE_TTL, max_entries: int = STATE_MAX_ENTRIES, max_bytes: int = STATE_MAX_BYTES) -> None:
+        self.ttl = float(ttl)
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.evictions = 0
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abc.abstractmethod
+    async def put(self, key: str, value: Dict[str, Any]) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def stats(self) -> Dict[str, Any]:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        # key -> (expires_at, encoded json)
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+
+    def _drop(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1].encode("utf-8"))
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._drop(key)
+            return None
+        self._data.move_to_end(key)
+        return json.loads(entry[1])
+
+    async def put(self, key: str, value: Dict[str, Any]) -> None:
+        raw = _encode(value)
+        self._drop(key)
+        self._data[key] = (time.monotonic() + self.ttl, raw)
+        self._bytes += len(raw.encode("utf-8"))
+
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._data))
+            self._drop(oldest)
+            self.evictions += 1
+
+    async def delete(self, key: str) -> None:
+        self._drop(key)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "entries": len(self._data), "bytes": self._bytes, "evictions": self.evictions}
+
+
+class SQLiteStateStore(StateStore):
+    def __init__(self, path: Path = STATE_STORE_PATH, evict_every: int = 32, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.path = Path(path)
+        self.evict_every = max(1, evict_every)
+        self._puts = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5.0)
+            # WAL lets several uvicorn workers read while one writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, nbytes INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS state_accessed ON state (accessed_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS state_expires ON state (expires_at)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            row = conn.execute("SELECT value, expires_at FROM state WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM state WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE state SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return row[0]
+
+    def _put(self, key: str, raw: str) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, nbytes, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, raw, len(raw.encode("utf-8")), now + self.ttl, now),
+            )
+            self._puts += 1
+            # Eviction scans the table, so amortize it over several writes
+            if self._puts % self.evict_every == 0:
+                self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM state WHERE expires_at <= ?", (now,))
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM state").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        over_entries = max(0, count - self.max_entries)
+        freed, dropped = 0, 0
+        for key, nbytes in conn.execute("SELECT key, nbytes FROM state ORDER BY accessed_at ASC").fetchall():
+            if dropped >= over_entries and total - freed <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM state WHERE key = ?", (key,))
+            freed += nbytes
+            dropped += 1
+        self.evictions += dropped
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM state WHERE key = ?", (key,))
+            conn.commit()
+
+    def _stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._db().execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM state").fetchone()
+        return {"backend": "sqlite", "path": str(self.path), "entries": count, "bytes": total, "evictions": self.evictions}
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await asyncio.to_thread(self._get, key)
+        return json.loads(raw) if raw is not None else None
+
+    async def put(self, key: str, value: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self._put, key, _encode(value))
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+    async def stats(self) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._stats)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def make_state_store(backend: str = STATE_STORE_BACKEND) -> StateStore:
+    """Builds the store selected by STATE_STORE_BACKEND (memory | sqlite)."""
+    if backend == "sqlite":
+        return SQLiteStateStore()
+    if backend != "memory":
+        raise ValueError(f"Unknown STATE_STORE_BACKEND: {backend!r}")
+    return MemoryStateStore()
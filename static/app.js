@@ -241,40 +241,47 @@ function beginNewRequest() {
   return currentAbortController.signal;
 }
 
-async function renderRecommendation(data) {
-  if (!data || !data.weather || !data.music || !data.music.playlist) {
-    throw new Error("Unexpected API response");
-  }
-
-  recommendationId = data.recommendation_id || data.recommendationId || null;
-  if (data.error) throw new Error(data.error);
-
-  if (resultLocation) resultLocation.textContent = data.weather.location;
-  if (weatherDescription) weatherDescription.textContent = data.weather.description;
-  if (weatherTemp) weatherTemp.textContent = `${Math.round(data.weather.temperature)} °C`;
+function renderWeather(weather) {
+  if (resultLocation) resultLocation.textContent = weather.location;
+  if (weatherDescription) weatherDescription.textContent = weather.description;
+  if (weatherTemp) weatherTemp.textContent = `${Math.round(weather.temperature)} °C`;
 
-  const moodKey = (data.weather.mood_key || data.weather.mood || "").toString();
+  const moodKey = (weather.mood_key || weather.mood || "").toString();
   if (resultMood) resultMood.textContent = moodKey ? moodKey.toUpperCase() : "—";
 
-  if (playlistName) playlistName.textContent = data.music.playlist.name;
+  // Dynamic weather icon
+  const icon = pickLucideIcon(weather.description, weather.mood_key);
+  setWeatherIcons(icon);
+}
+
+function renderPlaylist(playlist) {
+  if (playlistName) playlistName.textContent = playlist.name;
 
-  const desc = data.music.playlist.description || "No description available";
+  const desc = playlist.description || "No description available";
   if (playlistDescription) {
     playlistDescription.textContent = desc.length > 100 ? desc.substring(0, 97) + "..." : desc;
   }
 
   if (playlistLink) {
-    playlistLink.href = data.music.playlist.url;
+    playlistLink.href = playlist.url;
     playlistLink.textContent = "Listen on Audius";
   }
 
-  if (playlistCover && data.music.playlist.artwork) {
-    playlistCover.style.backgroundImage = `url(${data.music.playlist.artwork})`;
+  if (playlistCover && playlist.artwork) {
+    playlistCover.style.backgroundImage = `url(${playlist.artwork})`;
   }
+}
 
-  // Dynamic weather icon
-  const icon = pickLucideIcon(data.weather.description, data.weather.mood_key);
-  setWeatherIcons(icon);
+async function renderRecommendation(data) {
+  if (!data || !data.weather || !data.music || !data.music.playlist) {
+    throw new Error("Unexpected API response");
+  }
+
+  recommendationId = data.recommendation_id || data.recommendationId || null;
+  if (data.error) throw new Error(data.error);
+
+  renderWeather(data.weather);
+  renderPlaylist(data.music.playlist);
 
   // Use tracks from mashup response directly
   const tracks = data.music.tracks || [];
@@ -284,6 +291,80 @@ async function renderRecommendation(data) {
   resultSection.classList.remove("hidden");
 }
 
+// Progressive mashup over Server-Sent Events: the weather card shows up as soon as
+// the backend knows the weather, the playlist and tracks follow when they're ready.
+function streamMashup(url, signal) {
+  return new Promise((resolve, reject) => {
+    const source = new EventSource(url);
+    let finished = false;
+
+    const finish = (err) => {
+      if (finished) return;
+      finished = true;
+      source.close();
+      if (err) reject(err);
+      else resolve();
+    };
+
+    signal.addEventListener("abort", () => finish(new DOMException("Aborted", "AbortError")));
+
+    source.addEventListener("weather", (e) => {
+      renderWeather(JSON.parse(e.data));
+      resultSection.classList.remove("hidden");
+      setStatus("Finding a playlist...");
+    });
+
+    source.addEventListener("playlist", (e) => {
+      renderPlaylist(JSON.parse(e.data).playlist);
+      setStatus("Loading tracks...");
+    });
+
+    source.addEventListener("tracks", (e) => {
+      renderNativePlayer(JSON.parse(e.data).tracks || []);
+    });
+
+    source.addEventListener("done", (e) => {
+      recommendationId = JSON.parse(e.data).recommendation_id || null;
+      setStatus("");
+      finish();
+    });
+
+    source.addEventListener("error", (e) => {
+      // Our own `error` events carry data; a dropped connection doesn't
+      let data = null;
+      try { data = e.data ? JSON.parse(e.data) : null; } catch (_) {}
+      finish(new Error((data && data.detail) || "Connection lost while loading recommendation."));
+    });
+  });
+}
+
+async function loadMashup(path, params, signal) {
+  const query = new URLSearchParams(params).toString();
+
+  if (window.EventSource) {
+    await streamMashup(`${path}/stream?${query}`, signal);
+    return;
+  }
+
+  const response = await fetch(`${path}?${query}`, { cache: "no-store", signal });
+
+  let data = null;
+  try {
+    data = await response.json();
+  } catch (_) {
+    // ignore JSON parse errors; handled below via status code
+  }
+
+  if (!response.ok) {
+    const msg = (data && (data.detail || data.error))
+      ? (data.detail || data.error)
+      : `Request failed (${response.status})`;
+    throw new Error(msg);
+  }
+
+  await renderRecommendation(data);
+}
+
 form.addEventListener("submit", async (e) => {
   e.preventDefault();
 
@@ -294,26 +375,7 @@ form.addEventListener("submit", async (e) => {
   setStatus("Fetching weather...");
 
   try {
-    const response = await fetch(
-      `/api/mashup?location=${encodeURIComponent(city)}`,
-      { cache: "no-store", signal }
-    );
-
-    let data = null;
-    try {
-      data = await response.json();
-    } catch (_) {
-      // ignore JSON parse errors; handled below via status code
-    }
-
-    if (!response.ok) {
-      const msg = (data && (data.detail || data.error))
-        ? (data.detail || data.error)
-        : `Request failed (${response.status})`;
-      throw new Error(msg);
-    }
-
-    await renderRecommendation(data);
+    await loadMashup("/api/mashup", { location: city }, signal);
   } catch (err) {
     if (err && err.name === "AbortError") return;
     console.error(err);
@@ -352,6 +414,9 @@ if (shuffleBtn) {
     throw new Error("Unexpected API response");
   }
 
+  // Signed-token mode hands back a new id that remembers what we've already shown
+  if (data.recommendation_id) recommendationId = data.recommendation_id;
+
   //uppdatera endast playlistdelen
   playlistName.textContent = data.playlist.name;
 
@@ -395,24 +460,7 @@ if (useLocationBtn) {
 
           setStatus("Fetching weather...");
 
-          const response = await fetch(
-            `/api/mashup/coords?lat=${encodeURIComponent(lat)}&lon=${encodeURIComponent(lon)}`,
-            { cache: "no-store", signal }
-          );
-
-          let data = null;
-          try {
-            data = await response.json();
-          } catch (_) {}
-
-          if (!response.ok) {
-            const msg = (data && (data.detail || data.error))
-              ? (data.detail || data.error)
-              : `Request failed (${response.status})`;
-            throw new Error(msg);
-          }
-
-          await renderRecommendation(data);
+          await loadMashup("/api/mashup/coords", { lat, lon }, signal);
         } catch (err) {
           if (err && err.name === "AbortError") return;
           console.error(err);
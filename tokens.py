@@ -0,0 +1,91 @@
+from __future__ import annotations
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+from config import env_bool, env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+# Stateless recommendation ids: the state regenerate needs travels inside the id itself,
+#
+#   base64url(zlib(json)) "." base64url(hmac_sha256(secret, payload)[:16])
+#
+# so any worker/node holding the same secret can serve regenerate without a shared store.
+
+RECOMMENDATION_TOKENS = env_bool("RECOMMENDATION_TOKENS", False)
+TOKEN_TTL = env_float("RECOMMENDATION_TOKEN_TTL", 60 * 60 * 6)
+TOKEN_MAX_SEEN = env_int("RECOMMENDATION_TOKEN_MAX_SEEN", 10)
+
+_SECRET = (os.getenv("RECOMMENDATION_TOKEN_SECRET") or "").encode("utf-8")
+if RECOMMENDATION_TOKENS and not _SECRET:
+    logger.warning("RECOMMENDATION_TOKEN_SECRET is not set; using a per-process secret (tokens won't work across workers)")
+    _SECRET = secrets.token_bytes(32)
+
+# Short keys keep the token compact
+_FIELDS = {
+    "mood_query": "q",
+    "keywords": "k",
+    "last_playlist_id": "l",
+    "seen_playlist_ids": "s",
+    "candidates": "p",
+    "cursor": "c",
+    "pool_ts": "t",
+}
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _mac(payload: str) -> str:
+    return _b64encode(hmac.new(_SECRET, payload.encode("ascii"), hashlib.sha256).digest()[:16])
+
+
+def sign_state(state: Dict[str, Any], ttl: float = TOKEN_TTL) -> str:
+    """Pack recommendation state into a signed, URL-safe token."""
+    compact = {short: state[name] for name, short in _FIELDS.items() if state.get(name) is not None}
+    if "s" in compact:
+        compact["s"] = list(compact["s"])[-TOKEN_MAX_SEEN:]
+    if "p" in compact:
+        # Only ids travel in the token; regenerate looks metadata up per pick
+        compact["p"] = [str(c.get("id")) for c in compact["p"]]
+    if "t" in compact:
+        compact["t"] = int(compact["t"])
+    compact["e"] = int(time.time() + ttl)
+
+    raw = json.dumps(compact, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    payload = _b64encode(zlib.compress(raw, 9))
+    return f"{payload}.{_mac(payload)}"
+
+
+def verify_state(token: str) -> Optional[Dict[str, Any]]:
+    """Returns the state inside a valid, unexpired token, else None."""
+    payload, _, mac = (token or "").partition(".")
+    if not payload or not mac or not token.isascii():
+        return None
+    if not hmac.compare_digest(mac, _mac(payload)):
+        return None
+
+    try:
+        compact = json.loads(zlib.decompress(_b64decode(payload)))
+    except (ValueError, zlib.error):
+        return None
+    if not isinstance(compact, dict) or int(compact.get("e", 0)) < time.time():
+        return None
+
+    state = {name: compact[short] for name, short in _FIELDS.items() if short in compact}
+    if "candidates" in state:
+        state["candidates"] = [{"id": pid} for pid in state["candidates"]]
+    return state
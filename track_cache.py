@@ -0,0 +1,108 @@
+from __future__ import annotations
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from singleflight import SingleFlight
+
+# Playlist-tracks cache, shared by mashup, regenerate and /api/music/playlist/{id}/tracks.
+#
+#   age < ttl      -> hit, returned as-is
+#   age >= ttl     -> conditional GET with the stored ETag / Last-Modified (when the
+#                     provider sent them); a 304 just restarts the entry's TTL
+#   missing        -> plain GET
+#
+# Bounded by total response bytes as well as entry count, least recently used first.
+
+Validators = Tuple[Optional[str], Optional[str]]  # (ETag, Last-Modified)
+
+# fetch(validators) -> (value, validators, size in bytes); value None means "not modified"
+Fetch = Callable[[Optional[Validators]], Awaitable[Tuple[Optional[Any], Validators, int]]]
+
+
+def _now() -> float:
+    return time.monotonic()
+
+
+class TrackCache:
+    def __init__(self, ttl: float, max_bytes: int = 32 << 20, max_entries: int = 1024) -> None:
+        self.ttl = float(ttl)
+        self.max_bytes = max(1, int(max_bytes))
+        self.max_entries = max(1, int(max_entries))
+        # key -> (stored_at, value, validators, size)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any, Validators, int]]" = OrderedDict()
+        self._bytes = 0
+        self._flight = SingleFlight()
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "revalidations": 0,
+            "not_modified": 0,
+            "evictions": 0,
+            "too_large": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[3]
+
+    def set(self, key: Hashable, value: Any, validators: Validators, size: int) -> None:
+        self._drop(key)
+        if size > self.max_bytes:
+            self.stats["too_large"] += 1
+            return
+        self._data[key] = (_now(), value, validators, size)
+        self._bytes += size
+        while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, _, _, evicted) = self._data.popitem(last=False)
+            self._bytes -= evicted
+            self.stats["evictions"] += 1
+
+    def delete(self, key: Hashable) -> None:
+        self._drop(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._bytes = 0
+
+    async def get_or_fetch(self, key: Hashable, fetch: Fetch) -> Any:
+        entry = self._data.get(key)
+        if entry is not None and _now() - entry[0] < self.ttl:
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+        return await self._flight.do(key, lambda: self._fetch(key, fetch))
+
+    async def _fetch(self, key: Hashable, fetch: Fetch) -> Any:
+        entry = self._data.get(key)
+        validators = entry[2] if entry is not None and any(entry[2]) else None
+        if validators is None:
+            self.stats["misses"] += 1
+        else:
+            self.stats["revalidations"] += 1
+
+        value, new_validators, size = await fetch(validators)
+        if value is None and entry is None:
+            # 304 with no body of ours to reuse (already counted as a miss): ask again
+            # without validators rather than caching None
+            value, new_validators, size = await fetch(None)
+            if value is None:
+                raise ValueError(f"not modified, but nothing cached for {key!r}")
+        elif value is None:
+            # 304: same body, fresh TTL (the entry may have been evicted meanwhile; put it back)
+            self.stats["not_modified"] += 1
+            value, size = entry[1], entry[3]
+            new_validators = new_validators if any(new_validators) else entry[2]
+        self.set(key, value, new_validators, size)
+        return value
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "size": len(self._data), "bytes": self._bytes, "coalescing": self._flight.snapshot()}
@@ -0,0 +1,136 @@
+from __future__ import annotations
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from config import env_bool, env_float, env_int
+from music import (
+    build_audius_queries,
+    get_audius_playlist_tracks,
+    rank_playlists,
+    search_audius_playlists,
+    to_playlist_summary,
+)
+from profile_rules import active_rules
+
+logger = logging.getLogger(__name__)
+
+# Pre-warmed bucket -> playlist index.
+#
+# compute_music_profile can only ever produce a small, fixed set of keyword lists
+# (bucket keywords + a few context extras), so we can enumerate them all, run their
+# searches in the background and keep the ranked playlists + first tracks ready.
+# A mashup whose keywords hit a warm entry then needs no Audius calls at all.
+
+WARM_INDEX = env_bool("WARM_INDEX", False)
+WARM_INDEX_INTERVAL = env_float("WARM_INDEX_INTERVAL", 60 * 15)
+WARM_INDEX_CONCURRENCY = env_int("WARM_INDEX_CONCURRENCY", 2)
+
+KeywordKey = Tuple[str, ...]
+
+
+def enumerate_keyword_sets() -> List[KeywordKey]:
+    """Every keyword list compute_music_profile can return, de-duplicated, in a stable order."""
+    rules = active_rules()
+    buckets: List[Tuple[str, List[str]]] = [(b, []) for b in rules.bucket_names]
+    buckets += [(f"{a}_{b}", [a, b]) for a, b in itertools.permutations(rules.score_names, 2)]
+    # Context values sampled at the active rules' own thresholds (cold / warm, overcast, ...)
+    samples = rules.context_samples()
+    names = list(samples)
+
+    out: Dict[KeywordKey, None] = {}
+    for (bucket, top_dims), values in itertools.product(buckets, itertools.product(*samples.values())):
+        view = dict(zip(names, values))
+        if bucket == "night_chill" and not view.get("is_night", True):
+            continue
+        keywords = rules.keywords(bucket, top_dims, view)
+        out[tuple(keywords)] = None
+    return list(out)
+
+
+class BucketIndex:
+    def __init__(
+        self,
+        search: Callable[..., Awaitable[List[Dict[str, Any]]]] = search_audius_playlists,
+        fetch_tracks: Callable[..., Awaitable[List[Dict[str, Any]]]] = get_audius_playlist_tracks,
+        interval: float = WARM_INDEX_INTERVAL,
+        concurrency: int = WARM_INDEX_CONCURRENCY,
+        pool_size: int = 20,
+        max_queries: int = 6,
+        search_limit: int = 15,
+        track_limit: int = 25,
+    ) -> None:
+        self.search = search
+        self.fetch_tracks = fetch_tracks
+        self.interval = interval
+        self.concurrency = max(1, concurrency)
+        self.pool_size = pool_size
+        self.max_queries = max_queries
+        self.search_limit = search_limit
+        self.track_limit = track_limit
+
+        # keywords -> {"ranked": [...summaries], "tracks": raw tracks of ranked[0], "ts": epoch}
+        self.entries: Dict[KeywordKey, Dict[str, Any]] = {}
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "builds": 0, "build_errors": 0}
+        self._task: Optional[asyncio.Task] = None
+
+    def lookup(self, keywords: Sequence[str]) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(tuple(keywords))
+        # Entries outlive one rebuild cycle, so a slow/failed rebuild doesn't drop them
+        if entry is None or (time.time() - entry["ts"]) > self.interval * 3:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return entry
+
+    async def build(self, keywords: KeywordKey) -> None:
+        queries = build_audius_queries(list(keywords), max_queries=self.max_queries)
+        candidates = await self.search(queries, limit=self.search_limit)
+        ranked = [to_playlist_summary(p) for p in rank_playlists(candidates, keywords, limit=self.pool_size)]
+        if not ranked:
+            return
+        tracks = await self.fetch_tracks(ranked[0]["id"], limit=self.track_limit)
+        self.entries[keywords] = {"ranked": ranked, "tracks": tracks, "ts": time.time()}
+        self.stats["builds"] += 1
+
+    async def rebuild(self) -> None:
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def _one(keywords: KeywordKey) -> None:
+            async with sem:
+                try:
+                    await self.build(keywords)
+                except Exception as e:
+                    self.stats["build_errors"] += 1
+                    logger.info("warm index build failed for %r: %r", keywords, e)
+
+        t0 = time.perf_counter()
+        keyword_sets = enumerate_keyword_sets()
+        await asyncio.gather(*(_one(k) for k in keyword_sets))
+        logger.info("warm index: %d keyword sets in %.1fs", len(keyword_sets), time.perf_counter() - t0)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.rebuild()
+            except Exception:
+                logger.exception("warm index rebuild failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self.entries), "running": self._task is not None}
@@ -1,9 +1,15 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 import httpx
 import os
 
+from cache import TTLCache
+from config import env_float, env_int
+from geocache import geocache, normalize_city
+from http_client import get_client
+from profile_rules import active_rules
+from singleflight import SingleFlight
 
 
 router = APIRouter(prefix="/api", tags=["weather"])
@@ -12,19 +18,42 @@ router = APIRouter(prefix="/api", tags=["weather"])
 _GEO_URL = "https://api.openweathermap.org/geo/1.0/direct"
 _WEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
 
+# Observation cache: lat/lon snapped to a grid (degrees, 0.05 ≈ 5 km), TTL ≈ upstream update cadence
+WEATHER_GRID_DEG = env_float("WEATHER_GRID_DEG", 0.05)
+_WEATHER_CACHE = TTLCache(
+    ttl=env_float("WEATHER_CACHE_TTL", 600.0),
+    max_entries=env_int("WEATHER_CACHE_SIZE", 4096),
+)
+
+# Concurrent identical geocode / weather fetches share one in-flight request
+_WEATHER_FLIGHT = SingleFlight()
+
 
 def _clamp(value: float, lo: float = 0.0, hi: float = 1.0) -> float:
     return max(lo, min(hi, value))
 
 
-def compute_music_profile(weather_json: Dict[str, Any]) -> Dict[str, Any]:
+def profile_keywords(
+    bucket: str,
+    top_dims: Sequence[str],
+    feels_like: float,
+    is_night: bool,
+    cloud_n: float,
+    rainy: bool,
+) -> List[str]:
     """
-    Turn OpenWeather current-weather JSON into a point-based profile that can drive music selection.
+    Bucket + context flags -> search keywords (per the active profile rules).
+    Split out of compute_music_profile so the full keyword space can be enumerated (see warm_index.py).
+    """
+    view = {"feels_like": feels_like, "is_night": is_night, "cloud_n": cloud_n, "rainy": rainy}
+    return active_rules().keywords(bucket, top_dims, view)
 
-    Outputs:
-      - scores: energy/brightness/cozy/intensity/focus in range 0..100
-      - bucket: a stable label for routing music logic
-      - keywords: short search terms suitable for a music provider
+
+def observation_features(weather_json: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pull the fields compute_music_profile scores on out of an OpenWeather payload,
+    normalized to 0..1 where it matters. weather_batch._columns does the same column-wise;
+    keep the two in step.
     """
     weather = (weather_json.get("weather") or [{}])[0]
     main = (weather.get("main") or "").lower()
@@ -59,152 +88,114 @@ def compute_music_profile(weather_json: Dict[str, Any]) -> Dict[str, Any]:
     # Comfort peaks around ~20°C and drops when far away (cold or hot)
     comfort = 1.0 - _clamp(abs(feels_like - 20.0) / 15.0)
 
-    # Start in the middle and push scores based on conditions
-    energy = 50
-    brightness = 50
-    cozy = 50
-    intensity = 50
-    focus = 50
-
-    # Categorical influence (Like we are a pro HAHA)
-    if "thunder" in main or "storm" in main:
-        intensity += 35
-        brightness -= 30
-        energy += 5
-        focus -= 10
-        cozy += 10
-    elif "rain" in main or "drizzle" in main:
-        cozy += 25
-        brightness -= 25
-        energy -= 15
-        intensity += 10
-        focus += 15
-    elif "snow" in main:
-        cozy += 15
-        energy -= 20
-        brightness += 5
-        focus += 15
-    elif "clear" in main:
-        energy += 20
-        brightness += 30
-        intensity -= 10
-        focus += 5
-        cozy -= 5
-    elif "cloud" in main:
-        brightness -= 15
-        cozy += 10
-        focus += 10
-        energy -= 5
-    elif any(k in main for k in ["mist", "fog", "haze", "smoke"]):
-        brightness -= 20
-        focus += 20
-        energy -= 10
-        cozy += 10
-
-    # Continuous modifiers (use “the whole response from API so we can loverage the most data we get”, not only description)
-    energy += round(15 * comfort)
-    brightness += round(12 * comfort)
-    cozy += round(10 * (1.0 - comfort))
-
-    brightness -= round(30 * cloud_n)
-    cozy += round(10 * cloud_n)
-    focus += round(8 * cloud_n)
-
-    cozy += round(15 * hum_n)
-    focus += round(6 * hum_n)
-    brightness -= round(10 * hum_n)
-
-    intensity += round(25 * wind_n) + round(10 * gust_n)
-    focus -= round(10 * wind_n)
-
-    focus += round(12 * (1.0 - vis_n))
-    brightness -= round(8 * (1.0 - vis_n))
-
-    if is_night:
-        brightness -= 15
-        focus += 10
-        cozy += 10
-        energy -= 5
-
-    # Light heuristic: low pressure can feel “stormy”
-    if isinstance(pressure, (int, float)) and pressure < 1005:
-        intensity += 5
-
-    def cap(v: int) -> int:
-        return int(max(0, min(100, v)))
-
-    # A simple "how positive does it feel" signal.
-    # Brightness and comfort tend to push it up; intensity and night pull it down.
-    raw_valence = (0.55 * brightness) + (0.25 * energy) + (0.20 * comfort * 100) - (0.35 * intensity)
-    if is_night:
-        raw_valence -= 8
-
-    scores = {
-        "energy": cap(energy),
-        "brightness": cap(brightness),
-        "cozy": cap(cozy),
-        "intensity": cap(intensity),
-        "focus": cap(focus),
-        "valence": cap(int(round(raw_valence))),
+    return {
+        "main": main,
+        "desc": desc,
+        "feels_like": feels_like,
+        "is_night": is_night,
+        "cloud_n": cloud_n,
+        "wind_n": wind_n,
+        "gust_n": gust_n,
+        "hum_n": hum_n,
+        "vis_n": vis_n,
+        "comfort": comfort,
+        "pressure": pressure,
     }
 
-    # Bucket: stable label that later drives Audius queries (it supposed to! hopefully it works HAHAHA)
-    if "thunder" in main or "storm" in desc:
-        bucket = "storm_intense"
-    elif is_night and scores["energy"] < 55:
-        bucket = "night_chill"
-    else:
-        top = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
-        bucket = f"{top[0][0]}_{top[1][0]}"
-
-    keyword_map = {
-        "energy": ["upbeat", "dance", "workout", "house", "pop"],
-        # Keep "summer" out of the default brightness keywords; we add it conditionally based on temperature + daylight.
-        "brightness": ["happy", "feel good", "sunny", "uplifting", "bright"],
-        "cozy": ["cozy", "lofi", "acoustic", "coffeehouse", "warm"],
-        "intensity": ["cinematic", "dark", "intense", "dramatic", "bass"],
-        "focus": ["focus", "study", "ambient", "instrumental", "chill"],
-        "storm_intense": ["storm", "cinematic", "dark", "intense", "ambient"],
-        "night_chill": ["night", "late night", "chill", "synthwave", "ambient"],
-    }
 
-    # combining top-2 dimensions to avoid headache
-    keywords: List[str] = []
-    if bucket in keyword_map:
-        keywords = keyword_map[bucket][:]
-    else:
-        top_dims = [d for d, _ in sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:2]]
-        for d in top_dims:
-            keywords.extend(keyword_map.get(d, []))
+def compute_music_profile(weather_json: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Turn OpenWeather current-weather JSON into a point-based profile that can drive music selection.
+
+    Outputs:
+      - scores: energy/brightness/cozy/intensity/focus in range 0..100
+      - bucket: a stable label for routing music logic
+      - keywords: short search terms suitable for a music provider
+
+    The rules themselves (categories, modifiers, buckets, keywords) live in profile_rules.py.
+    """
+    return active_rules().profile(observation_features(weather_json))
+
+
+def mood_from_scores(scores: Dict[str, int]) -> str:
+    """Collapse the profile's valence score into happy / neutral / sad."""
+    valence = int(scores.get("valence", 50))
+    if valence >= 60:
+        return "happy"
+    if valence <= 40:
+        return "sad"
+    return "neutral"
+
+
+async def geocode_city(city_name: str, api_key: str) -> Tuple[float, float]:
+    """
+    City name -> (lat, lon). Served from the geocoding cache when possible,
+    since coordinates never change; only misses hit OpenWeather.
+    """
+    cached = await geocache.get(city_name)
+    if cached is not None:
+        return cached
+
+    geo_resp = await _WEATHER_FLIGHT.do(
+        ("geocode", normalize_city(city_name)),
+        lambda: get_client().get(
+            _GEO_URL,
+            params={"q": city_name, "limit": 1, "appid": api_key},
+            timeout=10.0,
+        ),
+    )
+
+    if geo_resp.status_code != 200:
+        raise HTTPException(status_code=geo_resp.status_code, detail="City not found or API error")
 
-        # de-dupy duggy doyy heeeee haaaa while preserving order
-        seen = set()
-        keywords = [k for k in keywords if not (k in seen or seen.add(k))]
+    geo = geo_resp.json()
+    if not geo:
+        raise HTTPException(status_code=404, detail="City not found or API error")
 
-    # --- Context-aware keyword tuning ---
-    # Prevent mismatches like "summer vibes" in freezing/dark weather.
-    cold = feels_like <= 8.0
-    warm = feels_like >= 22.0
+    coords = (geo[0]["lat"], geo[0]["lon"])
+    await geocache.set(city_name, coords)
+    return coords
 
-    if cold:
-        keywords.extend(["winter", "cold", "cozy"])
-    elif warm and (not is_night) and cloud_n < 0.5:
-        keywords.extend(["summer", "sunshine"])
 
-    if is_night:
-        keywords.extend(["night", "late night"])
+def weather_cell(lat: float, lon: float, grid: float = WEATHER_GRID_DEG) -> Tuple[float, float]:
+    """Snap coordinates to the centre of their grid cell (neighbours share one cell)."""
+    if grid <= 0:
+        return float(lat), float(lon)
+    return round(round(lat / grid) * grid, 6), round(round(lon / grid) * grid, 6)
 
-    if cloud_n >= 0.8:
-        keywords.extend(["overcast", "moody"])
 
-    if "rain" in main or "drizzle" in main or "rain" in desc:
-        keywords.extend(["rainy day", "lofi beats"])
+async def fetch_current_weather(lat: float, lon: float, api_key: str) -> Dict[str, Any]:
+    """
+    Current-weather JSON for a location, cached per grid cell.
+    OpenWeather only updates every ~10 minutes, so the city and coords paths share one entry.
+    Raises httpx errors as-is; callers map them to their own HTTPExceptions.
+    """
+    cell = weather_cell(lat, lon)
 
-    # de-dupe while preserving order
-    seen = set()
-    keywords = [k for k in keywords if not (k in seen or seen.add(k))]
+    async def _fetch() -> Dict[str, Any]:
+        r = await get_client().get(
+            _WEATHER_URL,
+            params={
+                "lat": cell[0],
+                "lon": cell[1],
+                "appid": api_key,
+                "units": "metric",
+                "lang": "en",
+            },
+            timeout=12.0,
+        )
+        r.raise_for_status()
+        return r.json()
 
-    return {"scores": scores, "bucket": bucket, "keywords": keywords}
+    return await _WEATHER_CACHE.get_or_fetch(cell, lambda: _WEATHER_FLIGHT.do(("weather", cell), _fetch))
+
+
+def upstream_stats() -> Dict[str, Any]:
+    """Coalescing + cache counters for the OpenWeather side (used by /api/debug/upstream)."""
+    return {
+        "coalescing": _WEATHER_FLIGHT.snapshot(),
+        "weather_cache": {**_WEATHER_CACHE.stats, "size": len(_WEATHER_CACHE)},
+    }
 
 
 class WeatherResponse(BaseModel):
@@ -222,6 +213,9 @@ class WeatherResponse(BaseModel):
     keywords: Optional[List[str]] = None
     scores: Optional[Dict[str, int]] = None
 
+    # Unix time of the forecast slot used (None = current observation)
+    forecast_time: Optional[int] = None
+
 @router.get("/weather/{city_name}", response_model=WeatherResponse)
 async def get_weather(city_name: str):
     openweather_api_key = os.getenv("OPENWEATHER_API_KEY")
@@ -232,34 +226,14 @@ async def get_weather(city_name: str):
         )
     """Fetch weather data for a given city and determine mood based on weather conditions."""
 
-    # Resolve city name -> coordinates (Geocoding API)
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        geo_resp = await client.get(
-            _GEO_URL,
-            params={"q": city_name, "limit": 1, "appid": openweather_api_key},
-        )
-
-        if geo_resp.status_code != 200:
-            raise HTTPException(status_code=geo_resp.status_code, detail="City not found or API error")
-
-        geo = geo_resp.json()
-        if not geo:
-            raise HTTPException(status_code=404, detail="City not found or API error")
-
-        lat = geo[0]["lat"]
-        lon = geo[0]["lon"]
-
-        # Fetch current weather for those coordinates
-        weather_resp = await client.get(
-            _WEATHER_URL,
-            params={"lat": lat, "lon": lon, "appid": openweather_api_key, "units": "metric"},
-        )
-
-        if weather_resp.status_code != 200:
-            raise HTTPException(status_code=weather_resp.status_code, detail="City not found or API error")
-
-        data = weather_resp.json()
+    # Resolve city name -> coordinates (cached, falls back to the Geocoding API)
+    lat, lon = await geocode_city(city_name, openweather_api_key)
 
+    # Fetch current weather for those coordinates (grid-cached, shared with the coords endpoint)
+    try:
+        data = await fetch_current_weather(lat, lon, openweather_api_key)
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail="City not found or API error") from e
 
     description = data["weather"][0]["description"]
     temperature = data["main"]["temp"]
@@ -267,14 +241,7 @@ async def get_weather(city_name: str):
     wind_speed = data["wind"]["speed"]
 
     profile = compute_music_profile(data)
-
-    valence = int((profile.get("scores") or {}).get("valence", 50))
-    if valence >= 60:
-        mood = "happy"
-    elif valence <= 40:
-        mood = "sad"
-    else:
-        mood = "neutral"
+    mood = mood_from_scores(profile.get("scores") or {})
 
     return WeatherResponse(
         lat=lat,
@@ -289,3 +256,45 @@ async def get_weather(city_name: str):
         keywords=profile["keywords"],
         scores=profile["scores"],
     )
+
+
+async def get_weather_by_coords(lat: float, lon: float) -> WeatherResponse:
+    """
+    Fetch weather for browser geolocation coordinates (no geocoding step).
+    Same response model as get_weather so the mashup pipeline can treat both alike.
+    """
+    key = (os.getenv("OPENWEATHER_API_KEY") or "").strip()
+    if not key:
+        raise HTTPException(status_code=500, detail="OPENWEATHER_API_KEY is missing (env not loaded)")
+
+    try:
+        payload = await fetch_current_weather(lat, lon, key)
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=502, detail=f"Weather API error: {e.response.status_code}") from e
+    except (httpx.RequestError, ValueError) as e:
+        raise HTTPException(status_code=502, detail=f"Weather request failed: {e!r}") from e
+
+    # Compute mood profile
+    try:
+        profile = compute_music_profile(payload)
+        scores = profile.get("scores") or {}
+
+        w0 = (payload.get("weather") or [{}])[0]
+        main_data = payload.get("main") or {}
+        wind_data = payload.get("wind") or {}
+
+        return WeatherResponse(
+            lat=lat,
+            lon=lon,
+            city=str(payload.get("name") or "Your location"),
+            description=str(w0.get("description") or w0.get("main") or "weather"),
+            temperature=float(main_data.get("temp", 0.0)),
+            humidity=int(main_data.get("humidity", 50)),
+            wind_speed=float(wind_data.get("speed", 0.0)),
+            mood=mood_from_scores(scores),
+            bucket=str(profile.get("bucket") or "neutral"),
+            keywords=profile.get("keywords") or [],
+            scores=scores,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Weather profiling failed: {e!r}") from e
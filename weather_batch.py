@@ -0,0 +1,236 @@
+from __future__ import annotations
+from typing import Any, Dict, List, NamedTuple, Sequence
+
+from profile_rules import COMPARISONS, TEXT_FIELDS, RuleSet, active_rules
+from weather import compute_music_profile
+
+try:
+    import numpy as np
+except ImportError:  # optional, see requirements-optional.txt
+    np = None
+
+# Batch version of weather.compute_music_profile for many observations at once
+# (forecast lists, grid sweeps, bulk city feeds).
+#
+# Each field is pulled out of all payloads in one pass and normalized as a column
+# (the same steps as weather.observation_features), rule conditions become boolean
+# masks over those columns, and the scoring, rounding, capping and top-2 ranking are
+# array ops over the same rule table. Keyword lists are resolved once per distinct
+# (bucket, top-2, context choice) combination. Every step does the same float64
+# operations in the same order as the scalar code, and np.rint rounds half-to-even
+# like round(), so the results are identical, not just close.
+# Without NumPy this falls back to calling compute_music_profile per payload.
+
+
+class _Text(NamedTuple):
+    """A string column: per-row codes into the distinct (lowercased) values."""
+    codes: "np.ndarray"
+    distinct: List[str]
+
+
+class _Raw(NamedTuple):
+    """A value kept as-is by observation_features: numbers (NaN for non-numbers) + truthiness."""
+    numbers: "np.ndarray"
+    truthy: "np.ndarray"
+
+
+# A parsed batch: name -> float/bool array, _Text or _Raw
+Columns = Dict[str, Any]
+
+
+def _clamp(values: "np.ndarray", lo: float = 0.0, hi: float = 1.0) -> "np.ndarray":
+    # fmin/fmax, like min()/max() in weather._clamp, turn NaN into the bound
+    return np.fmax(lo, np.fmin(hi, values))
+
+
+def _floats(values: Sequence[Any]) -> "np.ndarray":
+    return np.fromiter(map(float, values), dtype=np.float64, count=len(values))
+
+
+def _ints(values: Sequence[Any]) -> "np.ndarray":
+    return np.fromiter(map(int, values), dtype=np.int64, count=len(values))
+
+
+def _text(values: Sequence[str]) -> _Text:
+    index = {v: i for i, v in enumerate(dict.fromkeys(values))}
+    codes = np.fromiter(map(index.__getitem__, values), dtype=np.intp, count=len(values))
+    return _Text(codes, [v.lower() for v in index])
+
+
+def _raw(values: Sequence[Any]) -> _Raw:
+    numbers = np.asarray([v if isinstance(v, (int, float)) else np.nan for v in values], dtype=np.float64)
+    return _Raw(numbers, np.fromiter(map(bool, values), dtype=bool, count=len(values)))
+
+
+def _columns(rules: RuleSet, payloads: Sequence[Dict[str, Any]]) -> Columns:
+    """Parse every payload into per-field columns (observation_features, column-wise), plus derived flags."""
+    weather = [(p.get("weather") or [{}])[0] for p in payloads]
+    m = [p.get("main") or {} for p in payloads]
+    w = [p.get("wind") or {} for p in payloads]
+    sys = [p.get("sys") or {} for p in payloads]
+
+    temp = _floats([x.get("temp", 0.0) for x in m])
+    feels_like = _floats([x.get("feels_like", t) for x, t in zip(m, temp.tolist())])
+    humidity = _ints([x.get("humidity", 50) for x in m])
+    wind_speed = _floats([x.get("speed", 0.0) for x in w])
+    wind_gust = _floats([g if g is not None else 0.0 for g in (x.get("gust") for x in w)])
+    clouds = np.asarray([(p.get("clouds") or {}).get("all", 0) for p in payloads], dtype=np.float64)
+    visibility = np.asarray([p.get("visibility", 10000) or 0 for p in payloads], dtype=np.float64)
+
+    dt = _ints([p.get("dt", 0) for p in payloads])
+    sunrise = _ints([x.get("sunrise", 0) for x in sys])
+    sunset = _ints([x.get("sunset", 0) for x in sys])
+
+    cols: Columns = {
+        "main": _text([x.get("main") or "" for x in weather]),
+        "desc": _text([x.get("description") or "" for x in weather]),
+        "feels_like": feels_like,
+        "is_night": (dt != 0) & (sunrise != 0) & (sunset != 0) & ((dt < sunrise) | (dt > sunset)),
+        "cloud_n": _clamp(clouds / 100.0),
+        "wind_n": _clamp(wind_speed / 12.0),
+        "gust_n": _clamp(wind_gust / 20.0),
+        "hum_n": _clamp((humidity - 40) / 60.0),
+        "vis_n": _clamp(visibility / 10000.0),
+        "comfort": 1.0 - _clamp(np.abs(feels_like - 20.0) / 15.0),
+        "pressure": _raw([x.get("pressure", 1013) for x in m]),
+    }
+    n = len(payloads)
+    for name, cond, _ in rules.derived:
+        if name not in cols:
+            cols[name] = _mask(cond, cols, n)
+    return cols
+
+
+def _mask(cond: Dict[str, Any], cols: Columns, n: int) -> "np.ndarray":
+    """A rule condition (see profile_rules) evaluated over whole columns at once."""
+    (op, arg), = cond.items()
+    if op in TEXT_FIELDS:
+        text = cols[TEXT_FIELDS[op]]
+        return _per_text(text, lambda t: any(str(needle) in t for needle in arg), n)
+    if op == "flag":
+        col = cols.get(str(arg))
+        if col is None:
+            return np.zeros(n, dtype=bool)
+        if isinstance(col, _Text):
+            return _per_text(col, bool, n)
+        return col.truthy if isinstance(col, _Raw) else col != 0
+    if op in COMPARISONS:
+        name, bound = arg
+        col = cols.get(str(name))
+        # Like the scalar predicate, only numbers pass (NaN never does)
+        if col is None or isinstance(col, _Text):
+            return np.zeros(n, dtype=bool)
+        return COMPARISONS[op](col.numbers if isinstance(col, _Raw) else col, bound)
+    if op == "any":
+        return np.logical_or.reduce([_mask(c, cols, n) for c in arg] + [np.zeros(n, dtype=bool)])
+    if op == "all":
+        return np.logical_and.reduce([_mask(c, cols, n) for c in arg] + [np.ones(n, dtype=bool)])
+    if op == "not":
+        return ~_mask(arg, cols, n)
+    raise ValueError(f"Unknown condition {op!r}")
+
+
+def _per_text(col: _Text, test: Any, n: int) -> "np.ndarray":
+    """test(string) for every row, evaluated once per distinct string."""
+    if not col.distinct:
+        return np.zeros(n, dtype=bool)
+    return np.array([test(t) for t in col.distinct], dtype=bool)[col.codes]
+
+
+def _first_match(masks: Sequence["np.ndarray"], n: int, default: int) -> "np.ndarray":
+    """Per row, the index of the first true mask (`default` for none)."""
+    out = np.full(n, default, dtype=np.intp)
+    for i in reversed(range(len(masks))):
+        out[masks[i]] = i
+    return out
+
+
+def _numbers(col: Any) -> "np.ndarray":
+    return col.numbers if isinstance(col, _Raw) else col
+
+
+def _iround(values: "np.ndarray") -> "np.ndarray":
+    return np.rint(values).astype(np.int64)
+
+
+def _rows(cols: Columns) -> int:
+    return len(cols["feels_like"])
+
+
+def score_matrix(rules: RuleSet, cols: Columns) -> "np.ndarray":
+    """(N, dims + 1) int64 scores in rules.score_names order from the columns built by _columns."""
+    n = _rows(cols)
+    dims = len(rules.dims)
+    lo, hi = rules.cap
+
+    values = np.full((n, dims), rules.base, dtype=np.int64)
+    # One delta row per category, plus a zero row for "no match"
+    category = _first_match([_mask(cond, cols, n) for cond, _, _ in rules.categories], n, len(rules.categories))
+    deltas = [delta for _, _, delta in rules.categories] + [(0,) * dims]
+    values += np.asarray(deltas, dtype=np.int64).reshape(-1, dims)[category]
+
+    for feature, invert, di, weight in rules.modifiers:
+        x = _numbers(cols[feature])
+        values[:, di] += _iround(weight * (1.0 - x if invert else x))
+
+    for cond, _, delta in rules.adjustments:
+        values += _mask(cond, cols, n)[:, None] * np.asarray(delta, dtype=np.int64)
+
+    # Same terms, in the same order, as RuleSet.profile
+    raw_valence = None
+    for di, feature, weight, scale in rules.valence_terms:
+        term = weight * values[:, di] if di is not None else weight * _numbers(cols[feature])
+        if scale is not None:
+            term = term * scale
+        raw_valence = term if raw_valence is None else raw_valence + term
+    for cond, _, add in rules.valence_adjustments:
+        raw_valence = np.where(_mask(cond, cols, n), raw_valence + add, raw_valence)
+
+    scores = np.empty((n, dims + 1), dtype=np.int64)
+    scores[:, :dims] = values
+    scores[:, dims] = _iround(raw_valence)
+    return np.clip(scores, lo, hi).astype(np.int64)
+
+
+def compute_music_profiles(payloads: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """compute_music_profile over many payloads; same output as calling it one by one."""
+    if np is None:
+        return [compute_music_profile(p) for p in payloads]
+    if not payloads:
+        return []
+
+    rules = active_rules()
+    cols = _columns(rules, payloads)
+    scores = score_matrix(rules, cols)
+    n = len(payloads)
+    names = rules.score_names
+
+    # argmax picks the first maximum, so ties keep score_names order like sorted(..., reverse=True)
+    first = np.argmax(scores, axis=1)
+    rest = scores.copy()
+    rest[np.arange(n), first] = np.iinfo(np.int64).min
+    second = np.argmax(rest, axis=1)
+
+    # Buckets see the capped scores under their names
+    bucket_cols = {**cols, **{name: scores[:, i] for i, name in enumerate(names)}}
+    bucket = _first_match([_mask(cond, bucket_cols, n) for _, cond, _ in rules.buckets], n, -1)
+    choice = [_first_match([_mask(cond, cols, n) for cond, _, _ in group], n, -1) for group in rules.context_rules]
+
+    # Few distinct (bucket, top-2, choice) combinations: resolve names + keywords once each.
+    # Each combination packs into one int64 (mixed radix, every part shifted to >= 0).
+    parts = [(bucket + 1, len(rules.buckets) + 1), (first, len(names)), (second, len(names))]
+    parts += [(c + 1, len(group) + 1) for c, group in zip(choice, rules.context_rules)]
+    key = np.zeros(n, dtype=np.int64)
+    for values, radix in parts:
+        key = key * radix + values
+    _, rows, inverse = np.unique(key, return_index=True, return_inverse=True)
+    resolved = []
+    for i in rows.tolist():
+        top_dims = (names[first[i]], names[second[i]])
+        name = rules.bucket_name(int(bucket[i]), top_dims)
+        resolved.append((name, rules.keywords_for(name, top_dims, tuple(int(c[i]) for c in choice))))
+
+    return [
+        {"scores": dict(zip(names, row)), "bucket": resolved[k][0], "keywords": resolved[k][1][:]}
+        for row, k in zip(scores.tolist(), inverse.reshape(-1).tolist())
+    ]